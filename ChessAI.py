@@ -2,98 +2,334 @@
 Handling the AI moves.
 """
 import random
+import time
 
-piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knight_scores = [[0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0],
-                 [0.1, 0.3, 0.5, 0.5, 0.5, 0.5, 0.3, 0.1],
-                 [0.2, 0.5, 0.6, 0.65, 0.65, 0.6, 0.5, 0.2],
-                 [0.2, 0.55, 0.65, 0.7, 0.7, 0.65, 0.55, 0.2],
-                 [0.2, 0.5, 0.65, 0.7, 0.7, 0.65, 0.5, 0.2],
-                 [0.2, 0.55, 0.6, 0.65, 0.65, 0.6, 0.55, 0.2],
-                 [0.1, 0.3, 0.5, 0.55, 0.55, 0.5, 0.3, 0.1],
-                 [0.0, 0.1, 0.2, 0.2, 0.2, 0.2, 0.1, 0.0]]
-
-bishop_scores = [[0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0],
-                 [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                 [0.2, 0.4, 0.5, 0.6, 0.6, 0.5, 0.4, 0.2],
-                 [0.2, 0.5, 0.5, 0.6, 0.6, 0.5, 0.5, 0.2],
-                 [0.2, 0.4, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2],
-                 [0.2, 0.6, 0.6, 0.6, 0.6, 0.6, 0.6, 0.2],
-                 [0.2, 0.5, 0.4, 0.4, 0.4, 0.4, 0.5, 0.2],
-                 [0.0, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.0]]
-
-rook_scores = [[0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25],
-               [0.5, 0.75, 0.75, 0.75, 0.75, 0.75, 0.75, 0.5],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.0, 0.25, 0.25, 0.25, 0.25, 0.25, 0.25, 0.0],
-               [0.25, 0.25, 0.25, 0.5, 0.5, 0.25, 0.25, 0.25]]
-
-queen_scores = [[0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0],
-                [0.2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.3, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.4, 0.4, 0.5, 0.5, 0.5, 0.5, 0.4, 0.3],
-                [0.2, 0.5, 0.5, 0.5, 0.5, 0.5, 0.4, 0.2],
-                [0.2, 0.4, 0.5, 0.4, 0.4, 0.4, 0.4, 0.2],
-                [0.0, 0.2, 0.2, 0.3, 0.3, 0.2, 0.2, 0.0]]
-
-pawn_scores = [[0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8, 0.8],
-               [0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7, 0.7],
-               [0.3, 0.3, 0.4, 0.5, 0.5, 0.4, 0.3, 0.3],
-               [0.25, 0.25, 0.3, 0.45, 0.45, 0.3, 0.25, 0.25],
-               [0.2, 0.2, 0.2, 0.4, 0.4, 0.2, 0.2, 0.2],
-               [0.25, 0.15, 0.1, 0.2, 0.2, 0.1, 0.15, 0.25],
-               [0.25, 0.3, 0.3, 0.0, 0.0, 0.3, 0.3, 0.25],
-               [0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2, 0.2]]
-
-piece_position_scores = {"wN": knight_scores,
-                         "bN": knight_scores[::-1],
-                         "wB": bishop_scores,
-                         "bB": bishop_scores[::-1],
-                         "wQ": queen_scores,
-                         "bQ": queen_scores[::-1],
-                         "wR": rook_scores,
-                         "bR": rook_scores[::-1],
-                         "wp": pawn_scores,
-                         "bp": pawn_scores[::-1]}
+import ChessBitboard
+from ChessBook import DEFAULT_BOOK_PATH, OpeningBook
+from ChessEvaluation import piece_score
+from ChessMoveOrdering import MoveOrderer
+from ChessTablebase import DEFAULT_TABLEBASE_DIRECTORY, LOSS, MAX_PIECES, WIN, Tablebases
+from ChessTransposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
 
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 3
+DRAW = 0  # score of a repetition or a fifty-move draw
+DEPTH = 3  # maximum depth of the iterative deepening
+TIME_LIMIT = None  # seconds per move, None searches every depth up to DEPTH
+USE_BITBOARDS = False  # search on a BitboardState copy of the position instead of the GameState itself
+TRANSPOSITION_TABLE_MB = 16
+QUIESCENCE_CHECK_EVASIONS = True  # keep searching out of check in the quiescence search instead of standing pat
+QUIESCENCE_MAX_DEPTH = 8
+DELTA_MARGIN = 2  # a capture must be able to lift the score to within this of alpha to be searched
+PIECE_SQUARE_WEIGHT = 1  # weight of the piece-square scores against material, 0 evaluates material alone
+OPENING_BOOK_PATH = DEFAULT_BOOK_PATH  # None plays without a book
+TABLEBASE_DIRECTORY = DEFAULT_TABLEBASE_DIRECTORY  # None plays without endgame tablebases
+TABLEBASE_WIN = 900  # score of a won tablebase position, less a hundredth per ply to mate so faster mates score higher
 
+transposition_table = TranspositionTable(TRANSPOSITION_TABLE_MB)
+move_orderer = MoveOrderer()
+opening_book = None  # opened on first use
+tablebases = None
 
-def findBestMove(game_state, valid_moves, return_queue):
-    global next_move
-    next_move = None
-    random.shuffle(valid_moves)
-    findMoveNegaMaxAlphaBeta(game_state, valid_moves, DEPTH, -CHECKMATE, CHECKMATE,
-                             1 if game_state.whiteToMove else -1)
-    return_queue.put(next_move)
+
+class SearchAborted(Exception):
+    """
+    Raised inside the search when its time or node budget runs out or it is told to stop.
+    reason is "time", "nodes" or "stopped".
+    """
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def findBestMove(game_state, valid_moves, return_queue, max_depth=None, time_limit=None, node_limit=None,
+                 stop_event=None, info_callback=None, stats=None, use_book=True, use_tablebases=True):
+    """
+    Iterative deepening search. Searches depth 1, 2, ... up to max_depth (DEPTH by default) and puts the best move
+    of the last completed depth on return_queue.
+    time_limit (seconds, TIME_LIMIT by default), node_limit and stop_event (anything with an is_set method, like a
+    multiprocessing.Event) end the search early. Depth 1 always completes so there is a move to play.
+    info_callback is called as info_callback(depth, score, best_move, nodes) after every completed depth, score
+    being from the point of view of the side to move.
+    stats, a ChessStats.SearchStats, is filled in with what the search did.
+    While the position is in the opening book (and use_book is True) a book move is played without searching, and
+    the same goes for the best move of a position in the endgame tablebases (if use_tablebases is True).
+    Below the root the tablebases give exact scores either way.
+    """
+    global next_move, search_depth, search_limits, nodes_searched, leaf_nodes, quiescence_nodes, scoreBoard
+    if max_depth is None:
+        max_depth = DEPTH
+    if time_limit is None:
+        time_limit = TIME_LIMIT
+    book_move = findBookMove(game_state, valid_moves) if use_book else None
+    if book_move is not None:
+        if stats is not None:
+            stats.best_move = book_move.getUciNotation()
+            stats.stop_reason = "book"
+        return_queue.put(book_move)
+        return
+    tablebase_move = findTablebaseMove(game_state, valid_moves) if use_tablebases else None
+    if tablebase_move is not None:
+        if stats is not None:
+            stats.best_move = tablebase_move.getUciNotation()
+            stats.stop_reason = "tablebase"
+        return_queue.put(tablebase_move)
+        return
+    if USE_BITBOARDS:
+        game_state = ChessBitboard.BitboardState.fromGameState(game_state)
+    valid_moves = list(valid_moves)
+    random.shuffle(valid_moves)  # only decides between moves the ordering ranks equally
+    transposition_table.newSearch()
+    move_orderer.newSearch()
+    start = time.perf_counter()
+    deadline = start + time_limit if time_limit is not None else None
+    search_limits = (deadline, node_limit, stop_event)
+    nodes_searched = leaf_nodes = quiescence_nodes = 0
+    root_moves = len(game_state.moveLog)
+    best_move = None
+    stop_reason = "depth" if valid_moves else "no moves"
+    if stats is not None:
+        tt_hits, tt_probes = transposition_table.hits, transposition_table.hits + transposition_table.misses
+        stats.instrument(game_state)
+        evaluate = scoreBoard
+        scoreBoard = stats.timed(evaluate, "evaluation")
+    try:
+        for depth in range(1, max_depth + 1):
+            search_depth = depth
+            next_move = None
+            depth_start_nodes = nodes_searched
+            try:
+                score = findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, -CHECKMATE, CHECKMATE,
+                                                 1 if game_state.whiteToMove else -1)
+            except SearchAborted as aborted:
+                stop_reason = aborted.reason
+                while len(game_state.moveLog) > root_moves:  # unwind the moves the search had made
+                    game_state.undoMove()
+                break
+            if next_move is not None:
+                best_move = next_move
+                # search the best move so far first on the next depth
+                valid_moves.remove(best_move)
+                valid_moves.insert(0, best_move)
+                if info_callback is not None:
+                    info_callback(depth, score, best_move, nodes_searched)
+                if stats is not None:
+                    stats.depth = depth
+                    stats.score = score
+                    stats.depth_nodes.append(nodes_searched - depth_start_nodes)
+    finally:
+        if stats is not None:
+            scoreBoard = evaluate
+            stats.time = time.perf_counter() - start
+            stats.uninstrument(game_state)
+            stats.nodes = nodes_searched
+            stats.leaf_nodes = leaf_nodes
+            stats.quiescence_nodes = quiescence_nodes
+            stats.best_move = best_move.getUciNotation() if best_move is not None else None
+            stats.stop_reason = stop_reason
+            stats.cutoffs = move_orderer.cutoffs
+            stats.first_move_cutoffs = move_orderer.first_move_cutoffs
+            stats.tt_hits = transposition_table.hits - tt_hits
+            stats.tt_probes = transposition_table.hits + transposition_table.misses - tt_probes
+    return_queue.put(best_move)
+
+
+def findBookMove(game_state, valid_moves):
+    """
+    A weighted random book move out of valid_moves, None when out of book or playing without a book.
+    """
+    global opening_book
+    if OPENING_BOOK_PATH is None:
+        return None
+    if opening_book is None or opening_book.path != OPENING_BOOK_PATH:
+        try:
+            opening_book = OpeningBook(OPENING_BOOK_PATH)
+        except (OSError, ValueError):
+            return None  # no usable book, so search every move
+    return opening_book.chooseMove(game_state, valid_moves)
+
+
+def openTablebases():
+    global tablebases
+    if tablebases is None or tablebases.directory != TABLEBASE_DIRECTORY:
+        tablebases = Tablebases(TABLEBASE_DIRECTORY)
+    return tablebases
+
+
+def findTablebaseMove(game_state, valid_moves):
+    """
+    The best move of a position covered by the endgame tablebases, None for any other position.
+    """
+    if TABLEBASE_DIRECTORY is None or game_state.piece_count > MAX_PIECES or not valid_moves:
+        return None
+    return openTablebases().bestMove(game_state, valid_moves)
+
+
+def tablebaseScore(game_state):
+    """
+    Exact score of game_state for the side to move from the endgame tablebases, None if they do not cover it.
+    """
+    if TABLEBASE_DIRECTORY is None or game_state.piece_count > MAX_PIECES:
+        return None
+    result = openTablebases().probe(game_state)
+    if result is None:
+        return None
+    outcome, plies = result
+    if outcome == WIN:
+        return TABLEBASE_WIN - plies / 100
+    if outcome == LOSS:
+        return -TABLEBASE_WIN + plies / 100
+    return DRAW
+
+
+def checkSearchLimits():
+    """
+    Raise SearchAborted if the running search is out of time or nodes or has been told to stop.
+    """
+    deadline, node_limit, stop_event = search_limits
+    if deadline is not None and time.perf_counter() >= deadline:
+        raise SearchAborted("time")
+    if node_limit is not None and nodes_searched >= node_limit:
+        raise SearchAborted("nodes")
+    if stop_event is not None and stop_event.is_set():
+        raise SearchAborted("stopped")
 
 
 def findMoveNegaMaxAlphaBeta(game_state, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move
+    """
+    Alpha-beta search of game_state to depth, score from the point of view of the side to move.
+    valid_moves is the move list at the root. Below it valid_moves is None and moves are pulled one at a time from
+    MoveOrderer.stagedMoves, so the moves after a beta cutoff are never generated or checked.
+    """
+    global next_move, nodes_searched, leaf_nodes
+    nodes_searched += 1
+    if search_depth > 1 and nodes_searched % 64 == 0:
+        checkSearchLimits()
+    if depth != search_depth:
+        if isSearchDraw(game_state):
+            return DRAW
+        if game_state.piece_count <= MAX_PIECES:
+            score = tablebaseScore(game_state)
+            if score is not None:
+                return score
     if depth == 0:
-        return turn_multiplier * scoreBoard(game_state)
-    # move ordering - implement later //TODO
+        leaf_nodes += 1
+        nodes_searched -= 1  # counted again by the quiescence search
+        return quiescenceSearch(game_state, alpha, beta, turn_multiplier, QUIESCENCE_MAX_DEPTH)
+
+    # transposition table lookup, the root always searches so that it picks next_move
+    alpha_original = alpha
+    entry = transposition_table.probe(game_state.zobrist_key)
+    hash_move_id = None
+    if entry is not None:
+        entry_depth, bound, entry_score, hash_move_id = entry
+        if entry_depth >= depth and depth != search_depth:
+            if bound == EXACT:
+                return entry_score
+            elif bound == LOWER_BOUND:
+                alpha = max(alpha, entry_score)
+            elif bound == UPPER_BOUND:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                return entry_score
+
+    # move ordering: hash move, captures by MVV-LVA, killers, quiet moves by history
+    ply = search_depth - depth
+    if valid_moves is None:
+        moves = move_orderer.stagedMoves(game_state, ply, hash_move_id)
+    else:
+        if hash_move_id is None and ply == 0 and valid_moves:
+            hash_move_id = valid_moves[0].moveID  # findBestMove puts the best move of the previous depth first
+        moves = move_orderer.orderMoves(valid_moves, ply, hash_move_id)
     max_score = -CHECKMATE
-    for move in valid_moves:
+    best_move = None  # set by the first move searched, so it stays None only without legal moves
+    for move_number, move in enumerate(moves):
         game_state.makeMove(move)
-        next_moves = game_state.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(game_state, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
-        if score > max_score:
+        score = -findMoveNegaMaxAlphaBeta(game_state, None, depth - 1, -beta, -alpha, -turn_multiplier)
+        if score > max_score or best_move is None:
             max_score = score
-            if depth == DEPTH:
+            best_move = move
+            if depth == search_depth:
                 next_move = move
         game_state.undoMove()
         if max_score > alpha:
             alpha = max_score
         if alpha >= beta:
+            move_orderer.recordCutoff(move, ply, depth, move_number)
             break
+    if best_move is None and not game_state.inCheck():
+        max_score = STALEMATE  # no legal moves and not in check, as opposed to every move getting mated
+
+    if max_score <= alpha_original:
+        bound = UPPER_BOUND
+    elif max_score >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    transposition_table.store(game_state.zobrist_key, depth, bound, max_score,
+                              best_move.moveID if best_move is not None else None)
+    return max_score
+
+
+def isSearchDraw(game_state):
+    """
+    Whether the search should score game_state as a draw. A position that already occurred once counts, as the side
+    that repeated it could repeat it again, so the search does not need to play out the full threefold repetition.
+    """
+    if game_state.position_counts[game_state.zobrist_key] >= 2:
+        return True
+    # a checkmate on the move that reaches the fifty-move limit still wins
+    return game_state.halfmove_clock >= 100 and not (game_state.inCheck() and not game_state.getValidMoves())
+
+
+def quiescenceSearch(game_state, alpha, beta, turn_multiplier, depth_left):
+    """
+    Search captures (and check evasions) until the position is quiet, so the search never stops in the middle of
+    an exchange. The side to move may always stand pat on the static score instead of capturing.
+    """
+    global nodes_searched, quiescence_nodes
+    nodes_searched += 1
+    quiescence_nodes += 1
+    if search_depth > 1 and nodes_searched % 64 == 0:
+        checkSearchLimits()
+    if depth_left < QUIESCENCE_MAX_DEPTH and game_state.piece_count <= MAX_PIECES:  # the first node was probed already
+        score = tablebaseScore(game_state)
+        if score is not None:
+            return score
+    moves = game_state.getCaptureMoves()  # every legal move when in check, which also finds checkmate
+    stand_pat = turn_multiplier * scoreBoard(game_state)
+    in_check = game_state.in_check and QUIESCENCE_CHECK_EVASIONS
+    if game_state.checkmate or game_state.stalemate or depth_left == 0:
+        return stand_pat
+    if game_state.in_check and not in_check:
+        moves = [move for move in moves if move.is_capture or move.is_pawn_promotion]
+    if in_check:
+        max_score = -CHECKMATE
+    else:
+        if stand_pat >= beta:
+            return stand_pat
+        # delta pruning: not even winning a queen gets back to alpha
+        if stand_pat + piece_score["Q"] + DELTA_MARGIN < alpha:
+            return stand_pat
+        max_score = stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+    for move in move_orderer.orderMoves(moves):
+        if not in_check:
+            gain = piece_score[move.pieceCaptured[1]] if move.is_capture else 0
+            if move.is_pawn_promotion:
+                gain += piece_score[move.promotionPiece] - piece_score["p"]
+            if stand_pat + gain + DELTA_MARGIN < alpha:  # delta pruning for this capture
+                continue
+        game_state.makeMove(move)
+        score = -quiescenceSearch(game_state, -beta, -alpha, -turn_multiplier, depth_left - 1)
+        game_state.undoMove()
+        if score > max_score:
+            max_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
     return max_score
 
 
@@ -108,20 +344,8 @@ def scoreBoard(game_state):
             return CHECKMATE  # white wins
     elif game_state.stalemate:
         return STALEMATE
-    score = 0
-    for row in range(len(game_state.board)):
-        for col in range(len(game_state.board[row])):
-            piece = game_state.board[row][col]
-            if piece != "--":
-                piece_position_score = 0
-                if piece[1] != "K":
-                    piece_position_score = piece_position_scores[piece][row][col]
-                if piece[0] == "w":
-                    score += piece_score[piece[1]] + piece_position_score
-                if piece[0] == "b":
-                    score -= piece_score[piece[1]] + piece_position_score
-
-    return score
+    # material and piece-square totals are kept up to date by makeMove and undoMove
+    return game_state.material_score + PIECE_SQUARE_WEIGHT * game_state.piece_square_score
 
 
 def findRandomMove(valid_moves):
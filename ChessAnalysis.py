@@ -0,0 +1,235 @@
+"""
+Batch position analysis.
+AnalysisService fans a stream of positions out over long-lived worker processes and streams back the best move and
+score of each. Results are cached by (Zobrist key, depth), so a position that comes up again, in the same batch or a
+later one, is answered without searching, and a position already being searched is not searched twice. Only a window
+of positions is read ahead of the results, so the input can be a generator over a whole archive.
+
+python ChessAnalysis.py positions.txt --depth 4          one FEN per line, JSON lines out in input order
+python ChessAnalysis.py --pgn games.pgn --depth 3 --workers 4 --unordered --output analysis.jsonl
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import time
+from multiprocessing import Process, Queue
+
+import ChessAI
+import ChessEngine
+import ChessPGN
+
+WINDOW_PER_WORKER = 16  # positions read ahead of the results for every worker
+POLL_INTERVAL = 0.5  # seconds between checks that the workers are still alive while waiting for a result
+
+
+class AnalysisService:
+    def __init__(self, workers=None, cache=None, window=None):
+        """
+        cache is any mapping to keep results in, a new dict if None, so it can be shared between services or
+        pre-filled. window is how many positions may be searching or waiting for an earlier one at a time.
+        """
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.cache = cache if cache is not None else {}
+        self.window = window if window is not None else WINDOW_PER_WORKER * self.workers
+        self.jobs = Queue()
+        self.results = Queue()
+        self.processes = [Process(target=workerLoop, args=(self.jobs, self.results), daemon=True)
+                          for worker in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        self.cache_hits = 0
+        self.searches = 0
+
+    def analyse(self, positions, depth=None, ordered=True):
+        """
+        Generate a result dict for every position of positions (FEN strings or GameStates): index, fen,
+        best_move (UCI, None without valid moves), score (for the side to move, None if not even depth 1 was
+        searched), depth, nodes and whether it came from the cache, or index, fen and error for a FEN that does not
+        parse or a search that failed. Failed searches are not cached.
+        With ordered the results come in input order, otherwise as soon as they are ready.
+        Raises RuntimeError if a worker process dies, since its position would never be answered.
+        """
+        if depth is None:
+            depth = ChessAI.DEPTH
+        positions = iter(positions)
+        exhausted = False
+        ready = []  # results that can be handed out
+        waiting = {}  # index -> result held back until the results before it are in
+        next_index = 0  # index of the next result to hand out in order
+        read = 0
+        in_flight = 0  # positions read but not handed out
+        searching = {}  # cache key -> results waiting for its search
+
+        def finish(result):
+            nonlocal next_index
+            if not ordered:
+                ready.append(result)
+                return
+            waiting[result["index"]] = result
+            while next_index in waiting:
+                ready.append(waiting.pop(next_index))
+                next_index += 1
+
+        while True:
+            while not exhausted and in_flight < self.window:
+                try:
+                    position = next(positions)
+                except StopIteration:
+                    exhausted = True
+                    break
+                result = {"index": read}
+                read += 1
+                in_flight += 1
+                try:
+                    game_state = positionState(position)
+                except ValueError as error:
+                    result["fen"] = position
+                    result["error"] = str(error)
+                    finish(result)
+                    continue
+                result["fen"] = game_state.getFen()
+                key = (game_state.zobrist_key, depth)
+                if key in self.cache:
+                    self.cache_hits += 1
+                    result.update(self.cache[key], cached=True)
+                    finish(result)
+                elif key in searching:
+                    self.cache_hits += 1
+                    result["cached"] = True
+                    searching[key].append(result)
+                else:
+                    self.searches += 1
+                    result["cached"] = False
+                    searching[key] = [result]
+                    self.jobs.put((key, result["fen"], depth))
+            for result in ready:
+                in_flight -= 1
+                yield result
+            ready.clear()
+            if in_flight == 0 and exhausted:
+                return
+            if not searching:
+                continue  # everything read so far came from the cache
+            try:
+                key, analysis = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError("an analysis worker process died")
+                continue
+            if "error" not in analysis:
+                self.cache[key] = analysis
+            for result in searching.pop(key, ()):  # none for a search left over from an abandoned batch
+                result.update(analysis)
+                finish(result)
+
+    def close(self):
+        for process in self.processes:
+            self.jobs.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+
+def positionState(position):
+    """
+    A GameState for position, a GameState (used as it is) or a FEN string. Raises ValueError for a bad FEN.
+    """
+    if isinstance(position, str):
+        game_state = ChessEngine.GameState()
+        game_state.loadFen(position.strip())
+        return game_state
+    return position
+
+
+def analysePosition(game_state, depth):
+    """
+    Search game_state to depth and return its best move, score, the depth reached and the nodes searched.
+    """
+    valid_moves = game_state.getValidMoves()
+    if not valid_moves:
+        return {"best_move": None, "score": -ChessAI.CHECKMATE if game_state.checkmate else ChessAI.STALEMATE,
+                "depth": 0, "nodes": 0}
+    return_queue = queue.Queue()
+    analysis = {"best_move": None, "score": None, "depth": 0, "nodes": 0}
+
+    def record(depth_reached, score, move, nodes):
+        analysis.update(best_move=move.getUciNotation(), score=score, depth=depth_reached, nodes=nodes)
+
+    # book moves come without a score, so every position is searched
+    ChessAI.findBestMove(game_state, valid_moves, return_queue, max_depth=depth, info_callback=record,
+                         use_book=False, use_tablebases=False)
+    if analysis["best_move"] is None:  # no depth completed, keep whatever move the search fell back on
+        move = return_queue.get()
+        analysis["best_move"] = move.getUciNotation() if move is not None else None
+    return analysis
+
+
+def workerLoop(jobs, results):
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        key, fen, depth = job
+        try:
+            game_state = ChessEngine.GameState()
+            game_state.loadFen(fen)
+            analysis = analysePosition(game_state, depth)
+        except Exception as error:  # report it and stay alive for the next position
+            analysis = {"error": "%s: %s" % (type(error).__name__, error)}
+        results.put((key, analysis))
+
+
+def pgnPositions(path):
+    """
+    The FEN of every position played in the games of the PGN file at path, stopping at a game's first bad move.
+    """
+    for game in ChessPGN.readPgnFile(path):
+        try:
+            for game_state, move in game.replay():
+                yield game_state.getFen()
+        except ValueError:
+            continue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse a batch of positions over a pool of worker processes.")
+    parser.add_argument("positions", nargs="?", help="file with one FEN per line (standard input if left out)")
+    parser.add_argument("--pgn", help="analyse every position of the games in this PGN file instead")
+    parser.add_argument("--depth", type=int, default=ChessAI.DEPTH)
+    parser.add_argument("--workers", type=int, help="worker processes (one per CPU if left out)")
+    parser.add_argument("--unordered", action="store_true", help="write results as they complete")
+    parser.add_argument("--output", help="file to write the JSON lines to (standard output if left out)")
+    args = parser.parse_args(argv)
+
+    if args.pgn is not None:
+        positions = pgnPositions(args.pgn)
+        input_file = None
+    else:
+        input_file = open(args.positions) if args.positions is not None else sys.stdin
+        positions = (line.strip() for line in input_file if line.strip() and not line.startswith("#"))
+    output = open(args.output, "w") if args.output is not None else sys.stdout
+    service = AnalysisService(args.workers)
+    start = time.perf_counter()
+    count = 0
+    try:
+        for result in service.analyse(positions, args.depth, ordered=not args.unordered):
+            output.write(json.dumps(result) + "\n")
+            count += 1
+    finally:
+        service.close()
+        if input_file not in (None, sys.stdin):
+            input_file.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print("%d positions, %d searched, %d from the cache in %.1fs (%.1f positions/s)"
+          % (count, service.searches, service.cache_hits, elapsed, count / elapsed if elapsed > 0 else 0),
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
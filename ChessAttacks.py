@@ -0,0 +1,104 @@
+"""
+Precomputed attack tables.
+Everything here is built once at import so move generation never has to redo direction or bounds arithmetic.
+Squares are numbered row * 8 + col (square 0 is a8, square 63 is h1) and bitboards use the same numbering.
+"""
+
+# (row step, col step) of the eight ray directions: up, left, down, right, then up-left, up-right, down-left, down-right
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+ROOK_DIRECTIONS = (0, 1, 2, 3)
+BISHOP_DIRECTIONS = (4, 5, 6, 7)
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+POSITIVE_DIRECTIONS = (2, 3, 6, 7)  # directions in which the square index increases
+OPPOSITE_DIRECTION = tuple(DIRECTIONS.index((-d_row, -d_col)) for d_row, d_col in DIRECTIONS)
+
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+PAWN_CAPTURE_STEPS = {"w": ((-1, -1), (-1, 1)), "b": ((1, -1), (1, 1))}
+
+
+def _stepSquares(square, steps):
+    """
+    The (row, col) squares reached from square by each step that stays on the board.
+    """
+    row, col = divmod(square, 8)
+    return tuple((row + d_row, col + d_col) for d_row, d_col in steps
+                 if 0 <= row + d_row < 8 and 0 <= col + d_col < 8)
+
+
+def _raySquares(square, direction):
+    """
+    The (row, col) squares from square (exclusive) to the edge of the board, nearest first.
+    """
+    row, col = divmod(square, 8)
+    d_row, d_col = direction
+    squares = []
+    end_row, end_col = row + d_row, col + d_col
+    while 0 <= end_row < 8 and 0 <= end_col < 8:
+        squares.append((end_row, end_col))
+        end_row += d_row
+        end_col += d_col
+    return tuple(squares)
+
+
+def _mask(squares):
+    mask = 0
+    for row, col in squares:
+        mask |= 1 << (row * 8 + col)
+    return mask
+
+
+# (row, col) targets for the 8x8 board generators in ChessEngine
+KNIGHT_SQUARES = [_stepSquares(square, KNIGHT_STEPS) for square in range(64)]
+KING_SQUARES = [_stepSquares(square, KING_STEPS) for square in range(64)]
+PAWN_CAPTURE_SQUARES = {color: [_stepSquares(square, steps) for square in range(64)]
+                        for color, steps in PAWN_CAPTURE_STEPS.items()}
+RAY_SQUARES = [tuple(_raySquares(square, direction) for direction in DIRECTIONS) for square in range(64)]
+
+# the same tables as bitboards
+KNIGHT_ATTACKS = [_mask(squares) for squares in KNIGHT_SQUARES]
+KING_ATTACKS = [_mask(squares) for squares in KING_SQUARES]
+PAWN_ATTACKS = {color: [_mask(squares) for squares in table] for color, table in PAWN_CAPTURE_SQUARES.items()}
+RAYS = [[_mask(RAY_SQUARES[square][direction]) for square in range(64)] for direction in range(8)]
+
+
+def firstBlocker(square, direction, occupied):
+    """
+    The first occupied square from square in the given direction, or -1 if the ray reaches the edge.
+    """
+    blockers = RAYS[direction][square] & occupied
+    if not blockers:
+        return -1
+    if direction in POSITIVE_DIRECTIONS:
+        return (blockers & -blockers).bit_length() - 1
+    return blockers.bit_length() - 1
+
+
+def slidingAttacks(square, occupied, directions):
+    """
+    Squares attacked by a slider on square along the given directions, stopping at (and including) the first blocker.
+    """
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][square]
+        blockers = ray & occupied
+        if blockers:
+            if direction in POSITIVE_DIRECTIONS:
+                first_blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                first_blocker = blockers.bit_length() - 1
+            ray ^= RAYS[direction][first_blocker]
+        attacks |= ray
+    return attacks
+
+
+def squaresOf(bitboard):
+    """
+    List of the square indices set in bitboard, lowest first.
+    """
+    squares = []
+    while bitboard:
+        lowest = bitboard & -bitboard
+        squares.append(lowest.bit_length() - 1)
+        bitboard ^= lowest
+    return squares
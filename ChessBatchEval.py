@@ -0,0 +1,100 @@
+"""
+Vectorised batch evaluation.
+Scores many positions in one NumPy operation instead of one GameState at a time, for leaf batching and for offline
+analysis of large position sets. The score is that of ChessAI.scoreBoard without the checkmate and stalemate cases,
+which need move generation: material plus PIECE_SQUARE_WEIGHT times the piece-square total, positive for white.
+Needs NumPy, unlike the rest of the engine.
+
+Positions come in one of two int8 encodings, squares numbered row * 8 + col from a8:
+(N, 64)      the piece code of every square, ChessEngine.PIECE_CODES (0 for an empty square)
+(N, 12, 64)  a 0/1 plane per piece in ChessEngine.PIECES order
+"""
+import numpy as np
+
+import ChessAI
+from ChessEngine import MATERIAL_VALUES, PIECE_CODES, PIECE_SQUARE_VALUES, PIECES
+
+CHUNK_POSITIONS = 1 << 16  # positions scored per vectorised step, bounding the temporary arrays
+
+# indexed by piece code, row 0 being the empty square
+MATERIAL_TABLE = np.array([0.0] + [MATERIAL_VALUES[piece] for piece in PIECES])
+PIECE_SQUARE_TABLE = np.array([[0.0] * 64] + [[score for row in PIECE_SQUARE_VALUES[piece] for score in row]
+                                              for piece in PIECES])
+SQUARES = np.arange(64)
+PIECE_PLANES = np.arange(1, len(PIECES) + 1, dtype=np.int8)
+
+
+def squareTable(piece_square_weight=None):
+    """
+    The (13, 64) score of every piece code on every square, PIECE_SQUARE_WEIGHT (ChessAI's by default) applied.
+    """
+    if piece_square_weight is None:
+        piece_square_weight = ChessAI.PIECE_SQUARE_WEIGHT
+    return MATERIAL_TABLE[:, None] + piece_square_weight * PIECE_SQUARE_TABLE
+
+
+def encodeCodes(game_states):
+    """
+    The (N, 64) piece code encoding of a sequence of GameStates.
+    """
+    codes = bytes(PIECE_CODES[square] for game_state in game_states for row in game_state.board for square in row)
+    return np.frombuffer(codes, dtype=np.int8).reshape(-1, 64)
+
+
+def codesToPlanes(codes):
+    """
+    The (N, 12, 64) plane encoding of an (N, 64) piece code array.
+    """
+    return (np.asarray(codes)[:, None, :] == PIECE_PLANES[None, :, None]).astype(np.int8)
+
+
+def planesToCodes(planes):
+    """
+    The (N, 64) piece code encoding of an (N, 12, 64) plane array, each square holding at most one piece.
+    """
+    return np.tensordot(np.asarray(planes), PIECE_PLANES, axes=([1], [0])).astype(np.int8)
+
+
+def evaluateCodes(codes, piece_square_weight=None):
+    """
+    Scores of an (N, 64) piece code array as an (N,) float64 array.
+    """
+    codes = np.asarray(codes)
+    table = squareTable(piece_square_weight)
+    scores = np.empty(len(codes))
+    for start in range(0, len(codes), CHUNK_POSITIONS):
+        chunk = codes[start:start + CHUNK_POSITIONS].astype(np.intp)
+        scores[start:start + CHUNK_POSITIONS] = table[chunk, SQUARES].sum(axis=1)
+    return scores
+
+
+def evaluatePlanes(planes, piece_square_weight=None):
+    """
+    Scores of an (N, 12, 64) plane array as an (N,) float64 array.
+    """
+    planes = np.asarray(planes)
+    weights = squareTable(piece_square_weight)[1:].reshape(-1)
+    scores = np.empty(len(planes))
+    for start in range(0, len(planes), CHUNK_POSITIONS):
+        chunk = planes[start:start + CHUNK_POSITIONS].reshape(-1, weights.size)
+        scores[start:start + CHUNK_POSITIONS] = chunk @ weights
+    return scores
+
+
+def evaluateBatch(positions, piece_square_weight=None):
+    """
+    Scores of a batch of positions in either encoding, told apart by the shape of the array.
+    """
+    positions = np.asarray(positions)
+    if positions.ndim == 2 and positions.shape[1] == 64:
+        return evaluateCodes(positions, piece_square_weight)
+    if positions.ndim == 3 and positions.shape[1:] == (len(PIECES), 64):
+        return evaluatePlanes(positions, piece_square_weight)
+    raise ValueError("expected an (N, 64) or (N, %d, 64) array, got shape %s" % (len(PIECES), positions.shape))
+
+
+def evaluateGameStates(game_states, piece_square_weight=None):
+    """
+    Scores of a sequence of GameStates, equal to their incrementally kept scores up to rounding.
+    """
+    return evaluateCodes(encodeCodes(game_states), piece_square_weight)
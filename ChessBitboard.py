@@ -0,0 +1,366 @@
+"""
+Bitboard representation of a chess position.
+Every piece type and colour is stored as one 64-bit integer with a bit set for each square it occupies.
+Squares are numbered row * 8 + col, so square 0 is a8 and square 63 is h1, the same layout as GameState.board.
+"""
+import copy
+
+from ChessAttacks import (BISHOP_DIRECTIONS, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, QUEEN_DIRECTIONS,
+                          ROOK_DIRECTIONS, firstBlocker, slidingAttacks, squaresOf)
+from ChessEngine import MOVE_ENPASSANT, MOVE_KIND_MASK, PIECES, GameState, Move
+
+
+class BitboardState(GameState):
+    """
+    A GameState that keeps a bitboard per piece next to the 8x8 board and generates moves from the bitboards.
+    The 8x8 board is still maintained as a mailbox so Move objects, scoring and the UI work unchanged,
+    which means ChessAI can search a BitboardState exactly like a GameState.
+    """
+    _bitboard_fields = ("bitboards", "occupancy", "occupied")
+
+    def __init__(self):
+        super().__init__()
+        self.loadBitboards()
+
+    @classmethod
+    def fromGameState(cls, game_state):
+        """
+        Build a BitboardState holding a copy of game_state, including its move and castling logs.
+        """
+        state = cls()
+        _copyAttributes(game_state, state, skip=("moveFunctions",) + cls._bitboard_fields)
+        state.loadBitboards()
+        return state
+
+    def toGameState(self):
+        """
+        Return a plain GameState holding a copy of this position.
+        """
+        game_state = GameState()
+        _copyAttributes(self, game_state, skip=("moveFunctions",) + self._bitboard_fields)
+        return game_state
+
+    def setupPosition(self, board, white_to_move=True, castle_rights=None, enpassant_possible=(), halfmove_clock=0,
+                      fullmove_number=1):
+        super().setupPosition(board, white_to_move, castle_rights, enpassant_possible, halfmove_clock,
+                              fullmove_number)
+        self.loadBitboards()
+
+    def loadBitboards(self):
+        """
+        Rebuild every bitboard and occupancy mask from self.board.
+        """
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    bit = 1 << (row * 8 + col)
+                    self.bitboards[piece] |= bit
+                    self.occupancy[piece[0]] |= bit
+        self.occupied = self.occupancy["w"] | self.occupancy["b"]
+
+    def makeMove(self, move):
+        squares = self._touchedSquares(move)
+        before = [self.board[row][col] for row, col in squares]
+        super().makeMove(move)
+        self._syncSquares(squares, before)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            squares = self._touchedSquares(self.moveLog[-1])
+            before = [self.board[row][col] for row, col in squares]
+            super().undoMove()
+            self._syncSquares(squares, before)
+
+    def _touchedSquares(self, move):
+        """
+        Every square whose contents change when move is made or undone.
+        """
+        squares = [(move.startRow, move.startCol), (move.endRow, move.endCol)]
+        if move.is_enpassant_move:
+            squares.append((move.startRow, move.endCol))
+        if move.is_castle_move:
+            if move.endCol - move.startCol == 2:  # king-side
+                squares += [(move.endRow, move.endCol + 1), (move.endRow, move.endCol - 1)]
+            else:  # queen-side
+                squares += [(move.endRow, move.endCol - 2), (move.endRow, move.endCol + 1)]
+        return squares
+
+    def _syncSquares(self, squares, before):
+        """
+        Bring the bitboards in line with self.board for the given squares, whose old contents are in before.
+        """
+        for (row, col), old_piece in zip(squares, before):
+            new_piece = self.board[row][col]
+            if new_piece != old_piece:
+                bit = 1 << (row * 8 + col)
+                if old_piece != "--":
+                    self.bitboards[old_piece] ^= bit
+                    self.occupancy[old_piece[0]] ^= bit
+                if new_piece != "--":
+                    self.bitboards[new_piece] ^= bit
+                    self.occupancy[new_piece[0]] ^= bit
+        self.occupied = self.occupancy["w"] | self.occupancy["b"]
+
+    def kingSquare(self, color):
+        return self.bitboards[color + "K"].bit_length() - 1
+
+    def isAttackedBy(self, square, color, occupied=None, removed=0):
+        """
+        Determine if any piece of color attacks square.
+        occupied overrides the occupancy used for sliders and removed masks out pieces that have just been captured.
+        """
+        if occupied is None:
+            occupied = self.occupied
+        bitboards = self.bitboards
+        keep = ~removed
+        if KNIGHT_ATTACKS[square] & bitboards[color + "N"] & keep:
+            return True
+        if KING_ATTACKS[square] & bitboards[color + "K"]:
+            return True
+        # a pawn of color attacks square exactly when a pawn of the other colour on square would attack it
+        if PAWN_ATTACKS["b" if color == "w" else "w"][square] & bitboards[color + "p"] & keep:
+            return True
+        queens = bitboards[color + "Q"]
+        rooks = (bitboards[color + "R"] | queens) & keep
+        if rooks and slidingAttacks(square, occupied, ROOK_DIRECTIONS) & rooks:
+            return True
+        bishops = (bitboards[color + "B"] | queens) & keep
+        if bishops and slidingAttacks(square, occupied, BISHOP_DIRECTIONS) & bishops:
+            return True
+        return False
+
+    def inCheck(self):
+        color = "w" if self.whiteToMove else "b"
+        return self.isAttackedBy(self.kingSquare(color), "b" if self.whiteToMove else "w")
+
+    def is_square_attacked(self, square, by_color):
+        return self.isAttackedBy(square, by_color)
+
+    def attackers_to(self, square, by_color=None):
+        """
+        The (row, col) of every piece attacking square, of both colors or only of by_color.
+        """
+        bitboards = self.bitboards
+        occupied = self.occupied
+        attackers = 0
+        for color in ("w", "b") if by_color is None else (by_color,):
+            queens = bitboards[color + "Q"]
+            attackers |= KNIGHT_ATTACKS[square] & bitboards[color + "N"]
+            attackers |= KING_ATTACKS[square] & bitboards[color + "K"]
+            attackers |= PAWN_ATTACKS["b" if color == "w" else "w"][square] & bitboards[color + "p"]
+            attackers |= slidingAttacks(square, occupied, ROOK_DIRECTIONS) & (bitboards[color + "R"] | queens)
+            attackers |= slidingAttacks(square, occupied, BISHOP_DIRECTIONS) & (bitboards[color + "B"] | queens)
+        return [divmod(attacker, 8) for attacker in squaresOf(attackers)]
+
+    def getValidMoves(self):
+        color = "w" if self.whiteToMove else "b"
+        enemy_color = "b" if self.whiteToMove else "w"
+        king_square = self.kingSquare(color)
+        self.in_check = self.isAttackedBy(king_square, enemy_color)
+        is_legal = self._legalityFilter(king_square, color, enemy_color)
+        moves = [move for move in self.getAllPossibleMoves() if is_legal(move)]
+        if not self.in_check:
+            self.getCastleMoves(king_square // 8, king_square % 8, moves)
+
+        if len(moves) == 0:
+            if self.in_check:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def getPseudoLegalMoves(self, captures):
+        """
+        Pseudo-legal moves of one generation stage and their legality check, see GameState.getPseudoLegalMoves.
+        """
+        color = "w" if self.whiteToMove else "b"
+        enemy_color = "b" if self.whiteToMove else "w"
+        king_square = self.kingSquare(color)
+        self.in_check = self.isAttackedBy(king_square, enemy_color)
+        self.checkmate = False
+        self.stalemate = False
+        moves = self.getAllPossibleMoves(captures_only=captures, quiets_only=not captures)
+        if not captures and not self.in_check:
+            self.getCastleMoves(king_square // 8, king_square % 8, moves)
+        return moves, self._legalityFilter(king_square, color, enemy_color)
+
+    def getLegalMove(self, move_id):
+        self.pins = []  # the mailbox move functions only see pins if told, the bitboards check legality instead
+        row, col = divmod(move_id & 63, 8)
+        piece = self.board[row][col]
+        if piece[0] != ("w" if self.whiteToMove else "b"):
+            return None
+        moves = []
+        if piece[1] == "K":
+            king_square = row * 8 + col
+            enemy_color = "b" if self.whiteToMove else "w"
+            for target in squaresOf(KING_ATTACKS[king_square] & ~self.occupancy[piece[0]]):
+                moves.append(Move((row, col), divmod(target, 8), self.board))
+            if not self.isAttackedBy(king_square, enemy_color):
+                self.getCastleMoves(row, col, moves)
+        else:
+            self.moveFunctions[piece[1]](row, col, moves)
+        for move in moves:
+            if move.moveID == move_id:
+                color = piece[0]
+                king_square = self.kingSquare(color)
+                enemy_color = "b" if color == "w" else "w"
+                self.in_check = self.isAttackedBy(king_square, enemy_color)
+                return move if self._legalityFilter(king_square, color, enemy_color)(move) else None
+        return None
+
+    def _legalityFilter(self, king_square, color, enemy_color):
+        """
+        Function telling if a pseudo-legal move of color keeps its king safe, for the position as it is now.
+        self.in_check must be up to date.
+        """
+        if self.in_check:
+            return lambda move: self._isLegal(move, king_square, enemy_color)
+        # only king moves, en passant captures and pinned pieces can expose the king when not in check
+        pinned = self.pinnedPieces(king_square, color, enemy_color)
+
+        def isLegal(move):
+            return (not (pinned >> (move.startRow * 8 + move.startCol) & 1 or move.pieceMoved[1] == "K"
+                         or move.moveID & MOVE_KIND_MASK == MOVE_ENPASSANT)
+                    or self._isLegal(move, king_square, enemy_color))
+        return isLegal
+
+    def pinnedPieces(self, king_square, color, enemy_color):
+        """
+        Bitboard of the pieces of color that are pinned against their king on king_square.
+        """
+        bitboards = self.bitboards
+        own = self.occupancy[color]
+        queens = bitboards[enemy_color + "Q"]
+        rooks = bitboards[enemy_color + "R"] | queens
+        bishops = bitboards[enemy_color + "B"] | queens
+        pinned = 0
+        for direction in QUEEN_DIRECTIONS:
+            blocker = firstBlocker(king_square, direction, self.occupied)
+            if blocker == -1 or not own >> blocker & 1:
+                continue
+            pinner = firstBlocker(blocker, direction, self.occupied)
+            if pinner != -1 and (rooks if direction in ROOK_DIRECTIONS else bishops) >> pinner & 1:
+                pinned |= 1 << blocker
+        return pinned
+
+    def _isLegal(self, move, king_square, enemy_color):
+        """
+        Determine if move leaves the mover's king safe, without making the move.
+        """
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        end_bit = 1 << end
+        occupied = (self.occupied & ~(1 << start)) | end_bit
+        if move.is_enpassant_move:
+            captured = 1 << (move.startRow * 8 + move.endCol)
+            occupied ^= captured
+        else:
+            captured = end_bit
+        if move.pieceMoved[1] == "K":
+            king_square = end
+        return not self.isAttackedBy(king_square, enemy_color, occupied, captured)
+
+    def getAllPossibleMoves(self, captures_only=False, quiets_only=False):
+        """
+        All pseudo-legal moves for the side to move, not counting castling.
+        With captures_only only captures and promotions are generated, with quiets_only everything else.
+        """
+        moves = []
+        board = self.board
+        bitboards = self.bitboards
+        color = "w" if self.whiteToMove else "b"
+        own = self.occupancy[color]
+        enemy = self.occupancy["b" if self.whiteToMove else "w"]
+        occupied = self.occupied
+
+        # pawns
+        step = -8 if self.whiteToMove else 8
+        start_row = 6 if self.whiteToMove else 1
+        promotion_row = 1 if self.whiteToMove else 6
+        enpassant_bit = 0
+        if self.enpassant_possible:
+            enpassant_bit = 1 << (self.enpassant_possible[0] * 8 + self.enpassant_possible[1])
+        for square in squaresOf(bitboards[color + "p"]):
+            row, col = divmod(square, 8)
+            first_move = len(moves)
+            one_step = square + step
+            if (not quiets_only if row == promotion_row else not captures_only) and not occupied >> one_step & 1:
+                moves.append(Move((row, col), divmod(one_step, 8), board))
+                two_step = one_step + step
+                if row == start_row and not occupied >> two_step & 1:
+                    moves.append(Move((row, col), divmod(two_step, 8), board))
+            if quiets_only:
+                continue
+            attacks = PAWN_ATTACKS[color][square]
+            for target in squaresOf(attacks & enemy):
+                moves.append(Move((row, col), divmod(target, 8), board))
+            if attacks & enpassant_bit:
+                moves.append(Move((row, col), self.enpassant_possible, board, is_enpassant_move=True))
+            if row == promotion_row:  # every promotion can also be to a rook, bishop or knight
+                for move in moves[first_move:]:
+                    for piece in ("R", "B", "N"):
+                        moves.append(Move((row, col), (move.endRow, move.endCol), board, promotion_piece=piece))
+
+        # pieces
+        not_own = enemy if captures_only else ~occupied if quiets_only else ~own
+        for square in squaresOf(bitboards[color + "N"]):
+            for target in squaresOf(KNIGHT_ATTACKS[square] & not_own):
+                moves.append(Move(divmod(square, 8), divmod(target, 8), board))
+        for square in squaresOf(bitboards[color + "B"]):
+            for target in squaresOf(slidingAttacks(square, occupied, BISHOP_DIRECTIONS) & not_own):
+                moves.append(Move(divmod(square, 8), divmod(target, 8), board))
+        for square in squaresOf(bitboards[color + "R"]):
+            for target in squaresOf(slidingAttacks(square, occupied, ROOK_DIRECTIONS) & not_own):
+                moves.append(Move(divmod(square, 8), divmod(target, 8), board))
+        for square in squaresOf(bitboards[color + "Q"]):
+            for target in squaresOf(slidingAttacks(square, occupied, QUEEN_DIRECTIONS) & not_own):
+                moves.append(Move(divmod(square, 8), divmod(target, 8), board))
+        for square in squaresOf(bitboards[color + "K"]):
+            for target in squaresOf(KING_ATTACKS[square] & not_own):
+                moves.append(Move(divmod(square, 8), divmod(target, 8), board))
+        return moves
+
+    def getCaptureMoves(self):
+        """
+        All legal captures and promotions, or every legal move when in check (see GameState.getCaptureMoves).
+        """
+        color = "w" if self.whiteToMove else "b"
+        enemy_color = "b" if self.whiteToMove else "w"
+        king_square = self.kingSquare(color)
+        self.in_check = self.isAttackedBy(king_square, enemy_color)
+        if self.in_check:
+            return self.getValidMoves()
+        self.checkmate = False
+        self.stalemate = False
+        is_legal = self._legalityFilter(king_square, color, enemy_color)
+        return [move for move in self.getAllPossibleMoves(captures_only=True) if is_legal(move)]
+
+    def getKingsideCastleMoves(self, row, col, moves):
+        square = row * 8 + col
+        if not self.occupied & (0b11 << (square + 1)):
+            enemy_color = "b" if self.whiteToMove else "w"
+            if not self.isAttackedBy(square + 1, enemy_color) and not self.isAttackedBy(square + 2, enemy_color):
+                moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
+
+    def getQueensideCastleMoves(self, row, col, moves):
+        square = row * 8 + col
+        if not self.occupied & (0b111 << (square - 3)):
+            enemy_color = "b" if self.whiteToMove else "w"
+            if not self.isAttackedBy(square - 1, enemy_color) and not self.isAttackedBy(square - 2, enemy_color):
+                moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
+
+
+def _copyAttributes(source, target, skip=()):
+    """
+    Deep copy the position attributes of source onto target, leaving the names in skip alone.
+    """
+    attributes = copy.deepcopy({name: value for name, value in vars(source).items() if name not in skip})
+    for name, value in attributes.items():
+        setattr(target, name, value)
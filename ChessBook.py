@@ -0,0 +1,187 @@
+"""
+Opening book.
+A book file is a sorted array of fixed-size records (Zobrist key, move id, weight) after a small header. It is
+memory-mapped and looked up by binary search on the key, so opening a book costs nothing and a lookup touches a
+handful of pages whatever the size of the book.
+
+python ChessBook.py build [--input LINES.txt] [--max-ply N] [--output book.bin]
+python ChessBook.py show [--book book.bin] [--fen FEN]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+import ChessEngine
+
+BOOK_MAGIC = b"CBK1"
+HEADER_STRUCT = struct.Struct("<4sI")  # magic, number of records
+RECORD_STRUCT = struct.Struct("<QHH")  # zobrist key, move id, weight
+KEY_STRUCT = struct.Struct("<Q")
+MAX_WEIGHT = 0xFFFF
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+DEFAULT_MAX_PLY = 16
+
+# main lines of common openings in UCI notation, the default source of book.bin
+STARTER_LINES = [
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8",  # Ruy Lopez
+    "e2e4 e7e5 g1f3 b8c6 f1b5 g8f6 e1g1 f6e4 d2d4 e4d6 b5c6 d7c6 d4e5 d6f5",  # Berlin
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d4 e5d4 c3d4 c5b4",  # Italian
+    "e2e4 e7e5 g1f3 b8c6 f1c4 g8f6 d2d3 f8e7 e1g1 e8g8",  # Two knights
+    "e2e4 e7e5 g1f3 b8c6 d2d4 e5d4 f3d4 g8f6 d4c6 b7c6",  # Scotch
+    "e2e4 e7e5 g1f3 g8f6 f3e5 d7d6 e5f3 f6e4 d2d4 d6d5",  # Petrov
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6 c1e3 e7e5",  # Najdorf
+    "e2e4 c7c5 g1f3 b8c6 d2d4 c5d4 f3d4 g8f6 b1c3 e7e5 d4b5 d7d6",  # Sveshnikov
+    "e2e4 c7c5 g1f3 e7e6 d2d4 c5d4 f3d4 b8c6 b1c3 d8c7",  # Taimanov
+    "e2e4 c7c5 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7 d2d3 d7d6",  # Closed Sicilian
+    "e2e4 c7c5 c2c3 g8f6 e4e5 f6d5 d2d4 c5d4 g1f3 b8c6",  # Alapin
+    "e2e4 e7e6 d2d4 d7d5 b1c3 g8f6 c1g5 f8e7 e4e5 f6d7",  # French classical
+    "e2e4 e7e6 d2d4 d7d5 b1d2 c7c5 e4d5 e6d5 g1f3 b8c6",  # French Tarrasch
+    "e2e4 e7e6 d2d4 d7d5 e4e5 c7c5 c2c3 b8c6 g1f3 d8b6",  # French advance
+    "e2e4 c7c6 d2d4 d7d5 b1c3 d5e4 c3e4 c8f5 e4g3 f5g6",  # Caro-Kann classical
+    "e2e4 c7c6 d2d4 d7d5 e4e5 c8f5 g1f3 e7e6 f1e2 c6c5",  # Caro-Kann advance
+    "e2e4 d7d5 e4d5 d8d5 b1c3 d5a5 d2d4 g8f6 g1f3 c8f5",  # Scandinavian
+    "e2e4 g7g6 d2d4 f8g7 b1c3 d7d6 c1e3 a7a6",  # Modern
+    "e2e4 d7d6 d2d4 g8f6 b1c3 g7g6 f2f4 f8g7 g1f3 e8g8",  # Pirc
+    "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8 g1f3 h7h6",  # Queen's Gambit Declined
+    "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6 b1c3 d5c4 a2a4 c8f5",  # Slav
+    "d2d4 d7d5 c2c4 d5c4 g1f3 g8f6 e2e3 e7e6 f1c4 c7c5",  # Queen's Gambit Accepted
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4 e2e3 e8g8 f1d3 d7d5",  # Nimzo-Indian
+    "d2d4 g8f6 c2c4 e7e6 g1f3 b7b6 g2g3 c8a6 b2b3 f8b4",  # Queen's Indian
+    "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 g1f3 e8g8 f1e2 e7e5",  # King's Indian
+    "d2d4 g8f6 c2c4 g7g6 b1c3 d7d5 c4d5 f6d5 e2e4 d5c3 b2c3 f8g7",  # Grunfeld
+    "d2d4 g8f6 c2c4 c7c5 d4d5 e7e6 b1c3 e6d5 c4d5 d7d6",  # Benoni
+    "d2d4 g8f6 g1f3 e7e6 c1f4 c7c5 e2e3 b8c6",  # London
+    "d2d4 f7f5 g2g3 g8f6 f1g2 e7e6 g1f3 f8e7 e1g1 e8g8",  # Dutch
+    "c2c4 e7e5 b1c3 g8f6 g1f3 b8c6 g2g3 d7d5 c4d5 f6d5",  # English
+    "c2c4 c7c5 g1f3 g8f6 b1c3 b8c6 g2g3 g7g6 f1g2 f8g7",  # Symmetrical English
+    "g1f3 d7d5 g2g3 g8f6 f1g2 e7e6 e1g1 f8e7 d2d3 e8g8",  # Reti
+]
+
+
+class OpeningBook:
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # mmap refuses empty files
+            self.file.close()
+            raise ValueError("%s is not an opening book" % path)
+        magic, self.records = HEADER_STRUCT.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or len(self.data) != HEADER_STRUCT.size + self.records * RECORD_STRUCT.size:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def entries(self, key):
+        """
+        The (move id, weight) pairs stored for the position with the given Zobrist key.
+        """
+        data = self.data
+        low, high = 0, self.records
+        while low < high:  # first record with a key >= key
+            middle = (low + high) // 2
+            if KEY_STRUCT.unpack_from(data, HEADER_STRUCT.size + middle * RECORD_STRUCT.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.records:
+            record_key, move_id, weight = RECORD_STRUCT.unpack_from(data, HEADER_STRUCT.size + low * RECORD_STRUCT.size)
+            if record_key != key:
+                break
+            entries.append((move_id, weight))
+            low += 1
+        return entries
+
+    def bookMoves(self, game_state, valid_moves=None):
+        """
+        The book moves of game_state that are valid there, as (move, weight) pairs.
+        A book built for another key layout or a rare key collision can never produce an illegal move.
+        """
+        if valid_moves is None:
+            valid_moves = game_state.getValidMoves()
+        moves_by_id = {move.moveID: move for move in valid_moves}
+        return [(moves_by_id[move_id], weight) for move_id, weight in self.entries(game_state.zobrist_key)
+                if move_id in moves_by_id and weight > 0]
+
+    def chooseMove(self, game_state, valid_moves=None, rng=random):
+        """
+        A book move picked at random with probability proportional to its weight, None when out of book.
+        """
+        book_moves = self.bookMoves(game_state, valid_moves)
+        if not book_moves:
+            return None
+        return rng.choices([move for move, weight in book_moves], [weight for move, weight in book_moves])[0]
+
+
+def writeBook(path, weights):
+    """
+    Write a book file from a dict of (zobrist key, move id) -> weight.
+    """
+    records = sorted(weights.items())
+    with open(path, "wb") as book_file:
+        book_file.write(HEADER_STRUCT.pack(BOOK_MAGIC, len(records)))
+        for (key, move_id), weight in records:
+            book_file.write(RECORD_STRUCT.pack(key, move_id, min(weight, MAX_WEIGHT)))
+    return len(records)
+
+
+def collectWeights(lines, max_ply=DEFAULT_MAX_PLY, weights=None):
+    """
+    Count how often each move is played from each position in the first max_ply plies of lines.
+    Every line is a sequence of UCI moves from the starting position. Raises ValueError on an illegal move.
+    """
+    if weights is None:
+        weights = {}
+    for line in lines:
+        game_state = ChessEngine.GameState()
+        for uci_move in line.split()[:max_ply]:
+            move = next((move for move in game_state.getValidMoves() if move.getUciNotation() == uci_move), None)
+            if move is None:
+                raise ValueError("illegal move %s in line %r" % (uci_move, line))
+            record = (game_state.zobrist_key, move.moveID)
+            weights[record] = weights.get(record, 0) + 1
+            game_state.makeMove(move)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect an opening book.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="build a book from lines of UCI moves")
+    build.add_argument("--input", help="text file with one line of UCI moves per game (the built-in lines if left out)")
+    build.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="plies of each line to put in the book")
+    build.add_argument("--output", default=DEFAULT_BOOK_PATH)
+    show = subparsers.add_parser("show", help="list the book moves of a position")
+    show.add_argument("--book", default=DEFAULT_BOOK_PATH)
+    show.add_argument("--fen", help="position to look up (the starting position if left out)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.input is not None:
+            with open(args.input) as lines_file:
+                lines = [line for line in lines_file if line.strip() and not line.startswith("#")]
+        else:
+            lines = STARTER_LINES
+        records = writeBook(args.output, collectWeights(lines, args.max_ply))
+        print("%d records from %d lines written to %s" % (records, len(lines), args.output))
+    else:
+        book = OpeningBook(args.book)
+        game_state = ChessEngine.GameState()
+        if args.fen is not None:
+            game_state.loadFen(args.fen)
+        for move, weight in sorted(book.bookMoves(game_state), key=lambda entry: -entry[1]):
+            print("%s %d" % (move.getUciNotation(), weight))
+        book.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
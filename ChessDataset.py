@@ -0,0 +1,238 @@
+"""
+Position datasets.
+A dataset file is a small header followed by fixed 40-byte records: the position as packed by
+GameState.encodePosition, the result of the game it comes from and an engine score. DatasetWriter appends positions
+as games are replayed, PositionDataset memory-maps a file and hands out NumPy views of the records without copying
+them, so millions of positions cost no loading time and only the pages that are touched. Reading needs NumPy.
+
+python ChessDataset.py build --pgn games.pgn [more.pgn ...] --output positions.bin [--skip-plies 8] [--depth 2]
+python ChessDataset.py show positions.bin [--count 5]
+"""
+import argparse
+import struct
+import sys
+
+import ChessEngine
+import ChessPGN
+from ChessEngine import POSITION_BYTES
+
+DATASET_MAGIC = b"CDS1"
+HEADER_STRUCT = struct.Struct("<4sI")  # magic, record size
+RECORD_STRUCT = struct.Struct("<%dsbh" % POSITION_BYTES)  # encoded position, result, score
+RESULT_VALUES = {"1-0": 1, "0-1": -1, "1/2-1/2": 0}  # from white's point of view
+NO_SCORE = -0x8000
+MAX_SCORE = 0x7FFF  # scores are stored in hundredths of a pawn for white and clipped to this
+
+
+class DatasetWriter:
+    def __init__(self, path, append=False):
+        """
+        Open a dataset file for writing, adding to the records already in it if append is set.
+        """
+        self.file = open(path, "ab" if append else "wb")
+        if self.file.tell() == 0:
+            self.file.write(HEADER_STRUCT.pack(DATASET_MAGIC, RECORD_STRUCT.size))
+        self.positions = 0
+
+    def write(self, game_state, result, score=None):
+        """
+        Append game_state with result ("1-0", "0-1" or "1/2-1/2") and score (pawns for white, None if unknown).
+        """
+        self.writeEncoded(game_state.encodePosition(), result, score)
+
+    def writeEncoded(self, data, result, score=None):
+        if score is None:
+            stored_score = NO_SCORE
+        else:
+            stored_score = max(-MAX_SCORE, min(MAX_SCORE, round(score * 100)))
+        self.file.write(RECORD_STRUCT.pack(data, RESULT_VALUES[result], stored_score))
+        self.positions += 1
+
+    def writeGame(self, game, skip_plies=0, scores=None):
+        """
+        Append every position of game, a ChessPGN.PgnGame with a decided result, after the first skip_plies plies.
+        scores, if given, is called with the FENs of those positions and returns their scores.
+        Returns the number of positions written, 0 for an undecided game or one with a bad move.
+        """
+        if game.result not in RESULT_VALUES:
+            return 0
+        positions = []
+        fens = []
+        try:
+            for ply, (game_state, move) in enumerate(game.replay()):
+                if ply >= skip_plies:
+                    positions.append(game_state.encodePosition())
+                    if scores is not None:
+                        fens.append(game_state.getFen())
+        except ValueError:
+            return 0
+        position_scores = scores(fens) if scores is not None else [None] * len(positions)
+        for data, score in zip(positions, position_scores):
+            self.writeEncoded(data, game.result, score)
+        return len(positions)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PositionDataset:
+    def __init__(self, path):
+        """
+        Memory-map the dataset at path. Raises ValueError if it is not a dataset file.
+        """
+        import numpy as np
+
+        self.path = path
+        with open(path, "rb") as dataset_file:
+            header = dataset_file.read(HEADER_STRUCT.size)
+            dataset_file.seek(0, 2)
+            size = dataset_file.tell()
+        if len(header) != HEADER_STRUCT.size:
+            raise ValueError("%s is not a position dataset" % path)
+        magic, record_size = HEADER_STRUCT.unpack(header)
+        if magic != DATASET_MAGIC or record_size != RECORD_STRUCT.size:
+            raise ValueError("%s is not a position dataset" % path)
+        count = (size - HEADER_STRUCT.size) // record_size  # a record cut short by a crashed writer is left out
+        if count:
+            self.records = np.memmap(path, dtype=recordDtype(), mode="r", offset=HEADER_STRUCT.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=recordDtype())  # mmap refuses to map nothing
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    @property
+    def squares(self):
+        """
+        (N, 32) uint8 view of the boards, two 4 bit piece codes a byte, low nibble first.
+        """
+        return self.records["squares"]
+
+    @property
+    def flags(self):
+        return self.records["flags"]
+
+    @property
+    def results(self):
+        return self.records["result"]
+
+    @property
+    def scores(self):
+        """
+        int16 view of the scores in hundredths of a pawn for white, NO_SCORE where there is none.
+        """
+        return self.records["score"]
+
+    def whiteToMove(self, start=0, stop=None):
+        return (self.flags[start:stop] & 1) == 0
+
+    def codes(self, start=0, stop=None):
+        """
+        The boards of records start to stop unpacked into an (n, 64) int8 array of piece codes, the encoding
+        ChessBatchEval scores. Unpacking makes a copy, so take it a batch at a time on a large dataset.
+        """
+        import numpy as np
+
+        squares = self.squares[start:stop]
+        return np.stack((squares & 0xF, squares >> 4), axis=-1).reshape(-1, 64).astype(np.int8)
+
+    def batches(self, batch_size):
+        """
+        Generate (start, records) for consecutive slices of batch_size records, views into the mapped file.
+        """
+        for start in range(0, len(self.records), batch_size):
+            yield start, self.records[start:start + batch_size]
+
+    def gameState(self, index):
+        game_state = ChessEngine.GameState()
+        game_state.loadEncodedPosition(self.records[index:index + 1].tobytes()[:POSITION_BYTES])
+        return game_state
+
+    def close(self):
+        """
+        Drop the mapping. Views handed out before keep it alive until they are gone.
+        """
+        import numpy as np
+
+        self.records = np.zeros(0, dtype=self.records.dtype)
+
+
+def recordDtype():
+    """
+    NumPy layout of a record, matching RECORD_STRUCT byte for byte.
+    """
+    import numpy as np
+
+    return np.dtype([("squares", np.uint8, (32,)), ("flags", np.uint8), ("enpassant", np.uint8),
+                     ("halfmove_clock", np.uint8), ("fullmove_number", "<u2"), ("result", np.int8),
+                     ("score", "<i2")])
+
+
+def engineScores(depth, workers=None):
+    """
+    A scores function for DatasetWriter.writeGame that searches every position to depth on an analysis service.
+    Returns (scores, service), the service to be closed when done.
+    """
+    from ChessAnalysis import AnalysisService
+
+    service = AnalysisService(workers)
+
+    def scores(fens):
+        return [None if result.get("score") is None else result["score"] if fen.split()[1] == "w" else -result["score"]
+                for fen, result in zip(fens, service.analyse(fens, depth))]
+
+    return scores, service
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect a position dataset.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="write the positions of PGN games to a dataset")
+    build.add_argument("--pgn", nargs="+", required=True)
+    build.add_argument("--output", required=True)
+    build.add_argument("--append", action="store_true", help="add to an existing dataset")
+    build.add_argument("--skip-plies", type=int, default=0, help="leave out the opening plies of every game")
+    build.add_argument("--depth", type=int, help="score every position with a search to this depth")
+    build.add_argument("--workers", type=int, help="worker processes for the scoring searches")
+    show = subparsers.add_parser("show", help="summarise a dataset")
+    show.add_argument("path")
+    show.add_argument("--count", type=int, default=5, help="positions to print")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        scores, service = engineScores(args.depth, args.workers) if args.depth is not None else (None, None)
+        games = 0
+        try:
+            with DatasetWriter(args.output, args.append) as writer:
+                for path in args.pgn:
+                    for game in ChessPGN.readPgnFile(path):
+                        if writer.writeGame(game, args.skip_plies, scores):
+                            games += 1
+        finally:
+            if service is not None:
+                service.close()
+        print("%d positions from %d games written to %s" % (writer.positions, games, args.output))
+    else:
+        dataset = PositionDataset(args.path)
+        results = dataset.results
+        print("%d positions: %d white wins, %d draws, %d black wins, %d scored"
+              % (len(dataset), (results == 1).sum(), (results == 0).sum(), (results == -1).sum(),
+                 (dataset.scores != NO_SCORE).sum()))
+        for index in range(min(args.count, len(dataset))):
+            score = dataset.scores[index]
+            print("%s  %+d  %s" % (dataset.gameState(index).getFen(), results[index],
+                                   "-" if score == NO_SCORE else "%.2f" % (score / 100)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,47 @@
 This Class is responsible for storing all the information about the current state of a chess game.
 It will also be responsible for determining the valid moves at the current state. It will also keep a move log.
 """
+import random
+import struct
 
+from ChessAttacks import (BISHOP_DIRECTIONS, DIRECTIONS, KING_SQUARES, KNIGHT_SQUARES, PAWN_CAPTURE_SQUARES,
+                          QUEEN_DIRECTIONS, RAY_SQUARES, ROOK_DIRECTIONS)
+from ChessEvaluation import piece_position_scores, piece_score
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = {piece[1].upper() if piece[0] == "w" else piece[1].lower(): piece for piece in PIECES}
+PIECE_FEN = {piece: symbol for symbol, piece in FEN_PIECES.items()}
+
+# binary positions: 32 bytes of 4 bit piece codes (0 for an empty square), flags, en passant square,
+# halfmove clock and fullmove number
+PIECE_CODES = {"--": 0, **{piece: code for code, piece in enumerate(PIECES, 1)}}
+CODE_PIECES = {code: piece for piece, code in PIECE_CODES.items()}
+POSITION_STRUCT = struct.Struct("<32sBBBH")
+POSITION_BYTES = POSITION_STRUCT.size
+
+# kinds of move in bits 12-14 of Move.moveID, promotions add the promotion piece index
+MOVE_ENPASSANT = 1 << 12
+MOVE_CASTLE = 2 << 12
+MOVE_PROMOTION = 4 << 12
+MOVE_KIND_MASK = 7 << 12
+
+# Zobrist keys: one random 64-bit number per piece per square, per castling right, per en passant file and for the
+# side to move. A position's key is the XOR of the numbers for everything that is true in it.
+_zobrist_random = random.Random(20230521)
+ZOBRIST_PIECES = {piece: [[_zobrist_random.getrandbits(64) for col in range(8)] for row in range(8)]
+                  for piece in PIECES}
+ZOBRIST_CASTLING = {right: _zobrist_random.getrandbits(64) for right in ("wks", "bks", "wqs", "bqs")}
+ZOBRIST_ENPASSANT = [_zobrist_random.getrandbits(64) for col in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# signed (positive for white) material and piece-square values of each piece on each square,
+# for the running evaluation totals kept by makeMove and undoMove
+MATERIAL_VALUES = {piece: piece_score[piece[1]] if piece[0] == "w" else -piece_score[piece[1]] for piece in PIECES}
+PIECE_SQUARE_VALUES = {piece: [[0.0] * 8 for row in range(8)] if piece[1] == "K" else
+                       [[score if piece[0] == "w" else -score for score in row] for row in piece_position_scores[piece]]
+                       for piece in PIECES}
 
 
 class GameState():
@@ -31,22 +71,197 @@ class GameState():
         self.checks = []
         self.enpassant_possible = ()
         self.enpassant_possible_log = [self.enpassant_possible]
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.halfmove_clock_log = [self.halfmove_clock]
+        self.fullmove_number = 1  # goes up after every black move, like in FEN
+        self.piece_count = 32  # pieces on the board, kings included
         self.current_castling_rights = CastleRights(True, True, True, True)
         self.castle_rights_log = [CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
                                                self.current_castling_rights.wqs, self.current_castling_rights.bqs)]
-
+        self.zobrist_key = self.computeZobristKey()
+        self.zobrist_key_log = [self.zobrist_key]
+        self.position_counts = {self.zobrist_key: 1}  # how often each zobrist key occurs in zobrist_key_log
+        self.material_score, self.piece_square_score = self.computeScores()
+        self.score_log = [(self.material_score, self.piece_square_score)]
 
         # # Naive Algo
         # self.checkMate = False
         # self.staleMate = False
 
+    def setupPosition(self, board, white_to_move=True, castle_rights=None, enpassant_possible=(), halfmove_clock=0,
+                      fullmove_number=1):
+        """
+        Replace the current position with the given one and start a fresh move log.
+        board is an 8x8 list of piece strings like self.board, castle_rights a CastleRights (no castling if None)
+        and enpassant_possible the (row, col) a pawn could capture en passant on, like self.enpassant_possible.
+        """
+        self.board = [list(row) for row in board]
+        self.whiteToMove = white_to_move
+        self.moveLog = []
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] == "wK":
+                    self.whiteKingLocation = (row, col)
+                elif self.board[row][col] == "bK":
+                    self.blackKingLocation = (row, col)
+        self.checkmate = False
+        self.stalemate = False
+        self.in_check = False
+        self.pins = []
+        self.checks = []
+        self.enpassant_possible = enpassant_possible
+        self.enpassant_possible_log = [self.enpassant_possible]
+        self.halfmove_clock = halfmove_clock
+        self.halfmove_clock_log = [self.halfmove_clock]
+        self.fullmove_number = fullmove_number
+        self.piece_count = sum(1 for row in self.board for piece in row if piece != "--")
+        if castle_rights is None:
+            castle_rights = CastleRights(False, False, False, False)
+        self.current_castling_rights = CastleRights(castle_rights.wks, castle_rights.bks,
+                                                    castle_rights.wqs, castle_rights.bqs)
+        self.castle_rights_log = [CastleRights(castle_rights.wks, castle_rights.bks,
+                                               castle_rights.wqs, castle_rights.bqs)]
+        self.zobrist_key = self.computeZobristKey()
+        self.zobrist_key_log = [self.zobrist_key]
+        self.position_counts = {self.zobrist_key: 1}  # how often each zobrist key occurs in zobrist_key_log
+        self.material_score, self.piece_square_score = self.computeScores()
+        self.score_log = [(self.material_score, self.piece_square_score)]
+
+    def loadFen(self, fen):
+        """
+        Set up the position described by a FEN string. The clock fields may be left out.
+        Raises ValueError if the FEN is malformed or the position impossible: a king missing, a pawn on the first or
+        eighth rank or the side not to move in check.
+        """
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError("FEN needs 4 or 6 fields: %r" % fen)
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: %r" % fields[0])
+        board = []
+        for rank in ranks:
+            row = []
+            for symbol in rank:
+                if symbol.isdigit():
+                    row.extend(["--"] * int(symbol))
+                elif symbol in FEN_PIECES:
+                    row.append(FEN_PIECES[symbol])
+                else:
+                    raise ValueError("unknown FEN piece %r" % symbol)
+            if len(row) != 8:
+                raise ValueError("FEN rank %r is not 8 squares long" % rank)
+            board.append(row)
+        if sum(row.count("wK") for row in board) != 1 or sum(row.count("bK") for row in board) != 1:
+            raise ValueError("FEN needs exactly one king of each color: %r" % fields[0])
+        if any(piece[1] == "p" for piece in board[0] + board[7]):
+            raise ValueError("FEN has a pawn on the first or eighth rank: %r" % fields[0])
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: %r" % fields[1])
+        white_to_move = fields[1] == "w"
+        # checked on a scratch position so a rejected FEN leaves this one as it was
+        position = GameState()
+        position.setupPosition(board, white_to_move)
+        king_row, king_col = position.blackKingLocation if white_to_move else position.whiteKingLocation
+        if position.is_square_attacked(king_row * 8 + king_col, fields[1]):
+            raise ValueError("FEN side not to move is in check: %r" % fen)
+        castling = fields[2]
+        if castling != "-" and (not castling or set(castling) - set("KQkq")):
+            raise ValueError("bad FEN castling rights %r" % castling)
+        castle_rights = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+        enpassant_possible = ()
+        if fields[3] != "-":
+            square = fields[3]
+            if len(square) != 2 or square[0] not in Move.filesToCols or square[1] not in ("3", "6"):
+                raise ValueError("bad FEN en passant square %r" % square)
+            enpassant_possible = (Move.ranksToRows[square[1]], Move.filesToCols[square[0]])
+        halfmove_clock, fullmove_number = 0, 1
+        if len(fields) == 6:
+            if not (fields[4].isdigit() and fields[5].isdigit()):
+                raise ValueError("bad FEN clocks %r %r" % (fields[4], fields[5]))
+            halfmove_clock, fullmove_number = int(fields[4]), max(int(fields[5]), 1)
+        self.setupPosition(board, white_to_move, castle_rights, enpassant_possible, halfmove_clock,
+                           fullmove_number)
 
+    def getFen(self):
+        """
+        FEN string of the current position.
+        """
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += PIECE_FEN[square]
+            ranks.append(rank + str(empty) if empty else rank)
+        rights = self.current_castling_rights
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + ("k" if rights.bks else "") + (
+            "q" if rights.bqs else "")
+        enpassant = "-"
+        if self.enpassant_possible:
+            row, col = self.enpassant_possible
+            enpassant = Move.colsToFiles[col] + Move.rowsToRanks[row]
+        return "%s %s %s %s %d %d" % ("/".join(ranks), "w" if self.whiteToMove else "b", castling or "-", enpassant,
+                                      self.halfmove_clock, self.fullmove_number)
+
+    def encodePosition(self):
+        """
+        The position packed into POSITION_BYTES bytes: a 4 bit piece code per square, then a flags byte
+        (side to move and castling rights), the en passant square, the halfmove clock and the fullmove number.
+        The clocks saturate at 255 and 65535.
+        """
+        codes = [PIECE_CODES[square] for row in self.board for square in row]
+        squares = bytes(codes[i] | codes[i + 1] << 4 for i in range(0, 64, 2))
+        rights = self.current_castling_rights
+        flags = ((not self.whiteToMove) | rights.wks << 1 | rights.wqs << 2 | rights.bks << 3 | rights.bqs << 4)
+        enpassant = self.enpassant_possible[0] * 8 + self.enpassant_possible[1] if self.enpassant_possible else 0xFF
+        return POSITION_STRUCT.pack(squares, flags, enpassant, min(self.halfmove_clock, 0xFF),
+                                    min(self.fullmove_number, 0xFFFF))
+
+    def loadEncodedPosition(self, data):
+        """
+        Set up a position packed by encodePosition.
+        """
+        squares, flags, enpassant, halfmove_clock, fullmove_number = POSITION_STRUCT.unpack(data)
+        codes = [code for byte in squares for code in (byte & 0xF, byte >> 4)]
+        if max(codes) >= len(CODE_PIECES):
+            raise ValueError("bad piece code in encoded position")
+        board = [[CODE_PIECES[code] for code in codes[row * 8:row * 8 + 8]] for row in range(8)]
+        castle_rights = CastleRights(bool(flags & 2), bool(flags & 8), bool(flags & 4), bool(flags & 16))
+        enpassant_possible = divmod(enpassant, 8) if enpassant != 0xFF else ()
+        self.setupPosition(board, not flags & 1, castle_rights, enpassant_possible, halfmove_clock, fullmove_number)
 
     def makeMove(self, move):
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[move.pieceMoved][move.startRow][move.startCol]
+        material = self.material_score
+        piece_squares = self.piece_square_score - PIECE_SQUARE_VALUES[move.pieceMoved][move.startRow][move.startCol]
+        kind = move.moveID & MOVE_KIND_MASK
+        if move.pieceCaptured != "--" and kind != MOVE_ENPASSANT:
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow][move.endCol]
+            material -= MATERIAL_VALUES[move.pieceCaptured]
+            piece_squares -= PIECE_SQUARE_VALUES[move.pieceCaptured][move.endRow][move.endCol]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.board[move.startRow][move.startCol] = "--"
         self.moveLog.append(move) #log the move so can undo it later
         self.whiteToMove = not self.whiteToMove # Alternate players
+        if move.pieceCaptured != "--":
+            self.piece_count -= 1
+            self.halfmove_clock = 0
+        elif move.pieceMoved[1] == "p":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.halfmove_clock_log.append(self.halfmove_clock)
+        if move.pieceMoved[0] == "b":
+            self.fullmove_number += 1
         # print(self.whiteToMove)
         # Update king's location
         if move.pieceMoved == 'wK':
@@ -55,33 +270,55 @@ class GameState():
             self.blackKingLocation = (move.endRow, move.endCol)
         
         # Pawn Promotion
-        if move.is_pawn_promotion:
+        if kind & MOVE_PROMOTION:
             # if not is_AI:
             #    promoted_piece = input("Promote to Q, R, B, or N:") #take this to UI later
             #    self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promoted_piece
             # else:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionPiece
+
+        placed_piece = self.board[move.endRow][move.endCol]
+        key ^= ZOBRIST_PIECES[placed_piece][move.endRow][move.endCol]
+        material += MATERIAL_VALUES[placed_piece] - MATERIAL_VALUES[move.pieceMoved]  # only changes on promotion
+        piece_squares += PIECE_SQUARE_VALUES[placed_piece][move.endRow][move.endCol]
 
         # enpassant move
-        if move.is_enpassant_move:
+        if kind == MOVE_ENPASSANT:
             self.board[move.startRow][move.endCol] = "--"  # capturing the pawn
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][move.startRow][move.endCol]
+            material -= MATERIAL_VALUES[move.pieceCaptured]
+            piece_squares -= PIECE_SQUARE_VALUES[move.pieceCaptured][move.startRow][move.endCol]
 
         # update enpassant_possible variable
         if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:  # only on 2 square pawn advance
             self.enpassant_possible = ((move.startRow + move.endRow) // 2, move.startCol)
+            key ^= ZOBRIST_ENPASSANT[move.startCol]
         else:
             self.enpassant_possible = ()
 
         # castle move
-        if move.is_castle_move:
+        if kind == MOVE_CASTLE:
+            rook = move.pieceMoved[0] + "R"
             if move.endCol - move.startCol == 2:  # king-side castle move
                 self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][
                     move.endCol + 1]  # moves the rook to its new square
                 self.board[move.endRow][move.endCol + 1] = '--'  # erase old rook
+                key ^= ZOBRIST_PIECES[rook][move.endRow][move.endCol + 1]
+                key ^= ZOBRIST_PIECES[rook][move.endRow][move.endCol - 1]
+                piece_squares += (PIECE_SQUARE_VALUES[rook][move.endRow][move.endCol - 1]
+                                  - PIECE_SQUARE_VALUES[rook][move.endRow][move.endCol + 1])
             else:  # queen-side castle move
                 self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][
                     move.endCol - 2]  # moves the rook to its new square
                 self.board[move.endRow][move.endCol - 2] = '--'  # erase old rook
+                key ^= ZOBRIST_PIECES[rook][move.endRow][move.endCol - 2]
+                key ^= ZOBRIST_PIECES[rook][move.endRow][move.endCol + 1]
+                piece_squares += (PIECE_SQUARE_VALUES[rook][move.endRow][move.endCol + 1]
+                                  - PIECE_SQUARE_VALUES[rook][move.endRow][move.endCol - 2])
+        self.zobrist_key = key
+        self.material_score = material
+        self.piece_square_score = piece_squares
+        self.score_log.append((material, piece_squares))
 
         self.enpassant_possible_log.append(self.enpassant_possible)
 
@@ -89,12 +326,13 @@ class GameState():
         self.updateCastleRights(move)
         self.castle_rights_log.append(CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
                                                    self.current_castling_rights.wqs, self.current_castling_rights.bqs))
-
-
+        self.zobrist_key_log.append(self.zobrist_key)
+        self.position_counts[self.zobrist_key] = self.position_counts.get(self.zobrist_key, 0) + 1
 
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
+            kind = move.moveID & MOVE_KIND_MASK
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteToMove = not self.whiteToMove
@@ -104,19 +342,36 @@ class GameState():
             if move.pieceMoved == 'bK':
                 self.blackKingLocation = (move.startRow, move.startCol)
             # undo en passant move
-            if move.is_enpassant_move:
+            if kind == MOVE_ENPASSANT:
                 self.board[move.endRow][move.endCol] = "--"  # leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
 
             self.enpassant_possible_log.pop()
             self.enpassant_possible = self.enpassant_possible_log[-1]
+            self.halfmove_clock_log.pop()
+            self.halfmove_clock = self.halfmove_clock_log[-1]
+            if move.pieceCaptured != "--":
+                self.piece_count += 1
+            if move.pieceMoved[0] == "b":
+                self.fullmove_number -= 1
 
             # undo castle rights
             self.castle_rights_log.pop()  # get rid of the new castle rights from the move we are undoing
-            self.current_castling_rights = self.castle_rights_log[
-                -1]  # set the current castle rights to the last one in the list
+            last_rights = self.castle_rights_log[-1]  # set the current castle rights to the last one in the list
+            # copy it, since updateCastleRights modifies the current rights in place on the next move
+            self.current_castling_rights = CastleRights(last_rights.wks, last_rights.bks,
+                                                        last_rights.wqs, last_rights.bqs)
+            count = self.position_counts[self.zobrist_key] - 1
+            if count:
+                self.position_counts[self.zobrist_key] = count
+            else:
+                del self.position_counts[self.zobrist_key]
+            self.zobrist_key_log.pop()
+            self.zobrist_key = self.zobrist_key_log[-1]
+            self.score_log.pop()
+            self.material_score, self.piece_square_score = self.score_log[-1]
             # undo the castle move
-            if move.is_castle_move:
+            if kind == MOVE_CASTLE:
                 if move.endCol - move.startCol == 2:  # king-side
                     self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
                     self.board[move.endRow][move.endCol - 1] = '--'
@@ -126,20 +381,47 @@ class GameState():
             self.checkmate = False
             self.stalemate = False
 
+    def repetitionCount(self):
+        """
+        How many times the current position has occurred in the game, this occurrence included.
+        Positions are told apart by zobrist key, which covers the side to move, castling and en passant rights.
+        """
+        return self.position_counts.get(self.zobrist_key, 0)
+
+    def isThreefoldRepetition(self):
+        return self.position_counts.get(self.zobrist_key, 0) >= 3
+
+    def isFiftyMoveDraw(self):
+        """
+        Fifty moves by each side without a capture or a pawn move. Checkmate on the last move still wins,
+        so callers should check for checkmate first.
+        """
+        return self.halfmove_clock >= 100
+
+    def isDraw(self):
+        """
+        Draw by threefold repetition or the fifty-move rule. Stalemate is reported by getValidMoves.
+        """
+        return self.halfmove_clock >= 100 or self.position_counts.get(self.zobrist_key, 0) >= 3
+
     def updateCastleRights(self, move):
         """
         Update the castle rights given the move
         """
+        rights = self.current_castling_rights
+        old_rights = (rights.wks, rights.bks, rights.wqs, rights.bqs)
         if move.pieceCaptured == "wR":
-            if move.endCol == 0:  # left rook
-                self.current_castling_rights.wqs = False
-            elif move.endCol == 7:  # right rook
-                self.current_castling_rights.wks = False
+            if move.endRow == 7:  # only a rook captured on its starting square costs a right
+                if move.endCol == 0:  # left rook
+                    self.current_castling_rights.wqs = False
+                elif move.endCol == 7:  # right rook
+                    self.current_castling_rights.wks = False
         elif move.pieceCaptured == "bR":
-            if move.endCol == 0:  # left rook
-                self.current_castling_rights.bqs = False
-            elif move.endCol == 7:  # right rook
-                self.current_castling_rights.bks = False
+            if move.endRow == 0:
+                if move.endCol == 0:  # left rook
+                    self.current_castling_rights.bqs = False
+                elif move.endCol == 7:  # right rook
+                    self.current_castling_rights.bks = False
 
         if move.pieceMoved == 'wK':
             self.current_castling_rights.wqs = False
@@ -160,6 +442,46 @@ class GameState():
                 elif move.startCol == 7:  # right rook
                     self.current_castling_rights.bks = False
 
+        # hash out every right that was just lost
+        for name, had_right in zip(("wks", "bks", "wqs", "bqs"), old_rights):
+            if had_right and not getattr(rights, name):
+                self.zobrist_key ^= ZOBRIST_CASTLING[name]
+
+    def computeZobristKey(self):
+        """
+        Compute the Zobrist key of the current position from scratch.
+        makeMove and undoMove keep self.zobrist_key up to date incrementally, this is for setting up and checking it.
+        """
+        key = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    key ^= ZOBRIST_PIECES[piece][row][col]
+        for name in ("wks", "bks", "wqs", "bqs"):
+            if getattr(self.current_castling_rights, name):
+                key ^= ZOBRIST_CASTLING[name]
+        if self.enpassant_possible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassant_possible[1]]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def computeScores(self):
+        """
+        Compute the material and piece-square totals of the current position from scratch, positive for white.
+        makeMove and undoMove keep self.material_score and self.piece_square_score up to date incrementally.
+        """
+        material = 0
+        piece_squares = 0.0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "--":
+                    material += MATERIAL_VALUES[piece]
+                    piece_squares += PIECE_SQUARE_VALUES[piece][row][col]
+        return material, piece_squares
+
     def getValidMoves(self):
         temp_castle_rights = CastleRights(self.current_castling_rights.wks, self.current_castling_rights.bks,
                                           self.current_castling_rights.wqs, self.current_castling_rights.bqs)
@@ -173,24 +495,8 @@ class GameState():
             kingCol = self.blackKingLocation[1]
         if self.in_check:
             if len(self.checks) == 1:
-                moves = self.getAllPossibleMoves()
-                check = self.checks[0]
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]
-                validSquares = []
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[1] == checkCol:
-                            break
-                for i in range(len(moves) -1, -1, -1):
-                    if moves[i].pieceMoved[1] != 'K':
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares:
-                            moves.remove(moves[i])
+                is_evasion = self.checkEvasionFilter()
+                moves = [move for move in self.getAllPossibleMoves() if is_evasion(move)]
             else:
                 self.getKingMoves(kingRow, kingCol, moves)
         else:
@@ -204,7 +510,6 @@ class GameState():
             if self.inCheck():
                 self.checkmate = True
             else:
-                # TODO stalemate on repeated moves
                 self.stalemate = True
         else:
             self.checkmate = False
@@ -244,22 +549,70 @@ class GameState():
     # # This is part of the naive algo
     # # Determine if the current player is in check
     def inCheck(self):
-        if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
-        else:
-            return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
-
-    # # Also part of the naive algo
-    # # Determine if the enemy can attack the square r, c
-    def squareUnderAttack(self,r,c):
-        self.whiteToMove = not self.whiteToMove # switch to opponent's turn
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: # If under attack
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        return self.is_square_attacked(kingRow * 8 + kingCol, "b" if self.whiteToMove else "w")
+
+    def squareUnderAttack(self, r, c):
+        """
+        Determine if the opponent of the side to move attacks the square r, c.
+        """
+        return self.is_square_attacked(r * 8 + c, "b" if self.whiteToMove else "w")
+
+    def is_square_attacked(self, square, by_color):
+        """
+        Determine if any piece of by_color attacks square (row * 8 + col).
+        Looks outward from the square for each kind of attacker instead of generating the other side's moves.
+        """
+        board = self.board
+        for row, col in KNIGHT_SQUARES[square]:
+            if board[row][col] == by_color + "N":
+                return True
+        for row, col in KING_SQUARES[square]:
+            if board[row][col] == by_color + "K":
                 return True
+        # a pawn of by_color attacks square exactly when a pawn of the other color on square would attack it
+        for row, col in PAWN_CAPTURE_SQUARES["b" if by_color == "w" else "w"][square]:
+            if board[row][col] == by_color + "p":
+                return True
+        rays = RAY_SQUARES[square]
+        for directions, sliders in ((ROOK_DIRECTIONS, ("R", "Q")), (BISHOP_DIRECTIONS, ("B", "Q"))):
+            for j in directions:
+                for row, col in rays[j]:
+                    piece = board[row][col]
+                    if piece != "--":
+                        if piece[0] == by_color and piece[1] in sliders:
+                            return True
+                        break
         return False
 
+    def attackers_to(self, square, by_color=None):
+        """
+        The (row, col) of every piece attacking square (row * 8 + col), of both colors or only of by_color.
+        """
+        board = self.board
+        attackers = []
+        for row, col in KNIGHT_SQUARES[square]:
+            if board[row][col][1] == "N":
+                attackers.append((row, col))
+        for row, col in KING_SQUARES[square]:
+            if board[row][col][1] == "K":
+                attackers.append((row, col))
+        for pawn_color in ("w", "b"):
+            for row, col in PAWN_CAPTURE_SQUARES["b" if pawn_color == "w" else "w"][square]:
+                if board[row][col] == pawn_color + "p":
+                    attackers.append((row, col))
+        rays = RAY_SQUARES[square]
+        for directions, sliders in ((ROOK_DIRECTIONS, ("R", "Q")), (BISHOP_DIRECTIONS, ("B", "Q"))):
+            for j in directions:
+                for row, col in rays[j]:
+                    piece = board[row][col]
+                    if piece != "--":
+                        if piece[1] in sliders:
+                            attackers.append((row, col))
+                        break
+        if by_color is not None:
+            attackers = [(row, col) for row, col in attackers if board[row][col][0] == by_color]
+        return attackers
 
     '''
     All moves without considering checks
@@ -277,10 +630,144 @@ class GameState():
                     # elif piece == 'R':
                     #     self.getRookMoves(r, c, moves)
         return moves
+
+    def checkEvasionFilter(self):
+        """
+        For a side in check from a single piece (self.checks as set by checkForPinsAndChecks), a function telling
+        if a move that already respects pins gets out of check: a king move, capturing the checker or blocking it.
+        """
+        king_row, king_col = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        check_row, check_col, direction_row, direction_col = self.checks[0]
+        valid_squares = {(check_row, check_col)}
+        if self.board[check_row][check_col][1] != 'N':
+            for i in range(1, 8):
+                square = (king_row + direction_row * i, king_col + direction_col * i)
+                if square == (check_row, check_col):
+                    break
+                valid_squares.add(square)
+
+        def isEvasion(move):
+            if move.pieceMoved[1] == 'K' or (move.endRow, move.endCol) in valid_squares:
+                return True
+            # en passant lands behind the checking pawn but still captures it
+            return (move.moveID & MOVE_KIND_MASK == MOVE_ENPASSANT
+                    and move.startRow == check_row and move.endCol == check_col)
+        return isEvasion
+
+    def getPseudoLegalMoves(self, captures):
+        """
+        The moves of one stage of the staged move generation (see MoveOrderer.stagedMoves): captures, en passant and
+        promotions if captures is true, every other move including castling if not.
+        Returns (moves, is_legal), is_legal being a function telling if one of the moves is legal, or None if they
+        all are. Checking is left to the caller, so moves that never get tried are never checked.
+        Pins are already respected here, only check evasions are left to is_legal.
+        """
+        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.checkmate = False
+        self.stalemate = False
+        king_row, king_col = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        if len(self.checks) > 1:  # double check, only the king can move and getKingMoves only makes safe moves
+            moves = []
+            self.getKingMoves(king_row, king_col, moves)
+            return [move for move in moves if (move.pieceCaptured != "--") == captures], None
+        if captures and not self.in_check:
+            return self._getCaptureMoves(), None
+        moves = [move for move in self.getAllPossibleMoves()
+                 if (move.pieceCaptured != "--" or move.moveID & MOVE_PROMOTION != 0) == captures]
+        if self.in_check:
+            return moves, self.checkEvasionFilter()
+        if not captures:
+            self.getCastleMoves(king_row, king_col, moves)
+        return moves, None
+
+    def getLegalMove(self, move_id):
+        """
+        The legal move with the packed id move_id in the current position, or None if there is none.
+        Only generates the moves of the piece on the start square, for trying a hash move before anything else.
+        """
+        row, col = divmod(move_id & 63, 8)
+        piece = self.board[row][col]
+        if piece[0] != ("w" if self.whiteToMove else "b"):
+            return None
+        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        if len(self.checks) > 1 and piece[1] != 'K':
+            return None
+        moves = []
+        self.moveFunctions[piece[1]](row, col, moves)
+        if piece[1] == 'K' and not self.in_check:
+            self.getCastleMoves(row, col, moves)
+        for move in moves:
+            if move.moveID == move_id:
+                if self.in_check and len(self.checks) == 1 and not self.checkEvasionFilter()(move):
+                    return None
+                return move
+        return None
+
+    def getCaptureMoves(self):
+        """
+        All legal captures and promotions, for the quiescence search.
+        When the side to move is in check every legal move is returned instead, since all of them are evasions.
+        Outside of check this does not look for stalemate.
+        """
+        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.in_check:
+            return self.getValidMoves()
+        self.checkmate = False
+        self.stalemate = False
+        return self._getCaptureMoves()
+
+    def _getCaptureMoves(self):
+        """
+        Captures and promotions respecting the pins in self.pins, for a side that is not in check.
+        """
+        moves = []
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        pinDirections = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in self.pins}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[0] != allyColor:
+                    continue
+                if piece[1] == 'p':  # pawns have at most four moves, so filter their full list
+                    pawnMoves = []
+                    self.getPawnMoves(r, c, pawnMoves)
+                    moves += [move for move in pawnMoves if move.is_capture or move.is_pawn_promotion]
+                elif piece[1] == 'N':
+                    if (r, c) not in pinDirections:
+                        for endRow, endCol in KNIGHT_SQUARES[r * 8 + c]:
+                            if self.board[endRow][endCol][0] == enemyColor:
+                                moves.append(Move((r, c), (endRow, endCol), self.board))
+                elif piece[1] == 'K':
+                    self.board[r][c] = "--"
+                    for endRow, endCol in KING_SQUARES[r * 8 + c]:
+                        if self.board[endRow][endCol][0] == enemyColor and \
+                                not self.is_square_attacked(endRow * 8 + endCol, enemyColor):
+                            self.board[r][c] = piece
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
+                            self.board[r][c] = "--"
+                    self.board[r][c] = piece
+                else:  # sliders only capture the first piece along each ray
+                    directions = {'R': ROOK_DIRECTIONS, 'B': BISHOP_DIRECTIONS}.get(piece[1], QUEEN_DIRECTIONS)
+                    pinDirection = pinDirections.get((r, c))
+                    rays = RAY_SQUARES[r * 8 + c]
+                    for j in directions:
+                        d = DIRECTIONS[j]
+                        if pinDirection is not None and pinDirection != d and pinDirection != (-d[0], -d[1]):
+                            continue
+                        for endRow, endCol in rays[j]:
+                            endPiece = self.board[endRow][endCol]
+                            if endPiece != "--":
+                                if endPiece[0] == enemyColor:
+                                    moves.append(Move((r, c), (endRow, endCol), self.board))
+                                break
+        return moves
+
     '''
     Get all pawn moves fro the pawn located at row, col and add these moves to the list
     '''
     def getPawnMoves(self, row, col, moves):
+        first_move = len(moves)
         piece_pinned = False
         pin_direction = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -302,12 +789,12 @@ class GameState():
             king_row, king_col = self.blackKingLocation
 
         if self.board[row + move_amount][col] == "--":  # 1 square pawn advance
-            if not piece_pinned or pin_direction == (move_amount, 0):
+            if not piece_pinned or pin_direction in ((move_amount, 0), (-move_amount, 0)):
                 moves.append(Move((row, col), (row + move_amount, col), self.board))
                 if row == startRow and self.board[row + 2 * move_amount][col] == "--":  # 2 square pawn advance
                     moves.append(Move((row, col), (row + 2 * move_amount, col), self.board))
         if col - 1 >= 0:  # capture to the left
-            if not piece_pinned or pin_direction == (move_amount, -1):
+            if not piece_pinned or pin_direction in ((move_amount, -1), (-move_amount, 1)):
                 if self.board[row + move_amount][col - 1][0] == enemy_color:
                     moves.append(Move((row, col), (row + move_amount, col - 1), self.board))
                 if (row + move_amount, col - 1) == self.enpassant_possible:
@@ -328,12 +815,14 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
-                            elif square != "--":
+                                break
+                            elif square != "--":  # only the first piece beyond the pawns matters
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
                         moves.append(Move((row, col), (row + move_amount, col - 1), self.board, is_enpassant_move=True))
         if col + 1 <= 7:  # capture to the right
-            if not piece_pinned or pin_direction == (move_amount, +1):
+            if not piece_pinned or pin_direction in ((move_amount, 1), (-move_amount, -1)):
                 if self.board[row + move_amount][col + 1][0] == enemy_color:
                     moves.append(Move((row, col), (row + move_amount, col + 1), self.board))
                 if (row + move_amount, col + 1) == self.enpassant_possible:
@@ -354,10 +843,16 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):
                                 attacking_piece = True
-                            elif square != "--":
+                                break
+                            elif square != "--":  # only the first piece beyond the pawns matters
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
                         moves.append(Move((row, col), (row + move_amount, col + 1), self.board, is_enpassant_move=True))
+        if row + move_amount in (0, 7):  # every promotion can also be to a rook, bishop or knight
+            for move in moves[first_move:]:
+                for piece in ("R", "B", "N"):
+                    moves.append(Move((row, col), (move.endRow, move.endCol), self.board, promotion_piece=piece))
 
     # def getPawnMoves(self, r, c, moves):
     #     # print(self.whiteToMove)
@@ -412,24 +907,20 @@ class GameState():
                 if self.board[r][c][1] != 'Q':
                     self.pins.remove(self.pins[i])
                 break
-        directions = ((-1,0), (0, -1), (1, 0), (0, 1)) # up, left, down, right i.e. valid directions the piece can travel in
         enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8): # For each direction, the rook can move up to 7 squares max
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor: # If there's a piece there, ensure it's an enemy piece
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else: # Friendly piece (same color)
-                            break
-                else: # off the board
-                    break
+        rays = RAY_SQUARES[r * 8 + c]
+        for j in ROOK_DIRECTIONS: # up, left, down, right i.e. valid directions the piece can travel in
+            d = DIRECTIONS[j]
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in rays[j]: # precomputed squares up to the edge of the board
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece == "--":
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    elif endPiece[0] == enemyColor: # If there's a piece there, ensure it's an enemy piece
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        break
+                    else: # Friendly piece (same color)
+                        break
 
     '''
     Get all knight moves fro the rook located at row, col and add these moves to the list
@@ -441,17 +932,13 @@ class GameState():
                 piecePinned = True
                 self.pins.remove(self.pins[i])
                 break
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        # Basically top left, top right, midTop left, midTop right, midBottom left, midBottom, right, bottom left, bottom right
+        if piecePinned:
+            return
         allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0] # target position
-            endCol = c + m[1] # target position
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol] # retrieve target piece
-                    if endPiece[0] != allyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+        for endRow, endCol in KNIGHT_SQUARES[r * 8 + c]: # only the target squares that are on the board
+            endPiece = self.board[endRow][endCol] # retrieve target piece
+            if endPiece[0] != allyColor:
+                moves.append(Move((r, c), (endRow, endCol), self.board))
     '''
     Get all bishop moves fro the rook located at row, col and add these moves to the list
     '''
@@ -464,24 +951,20 @@ class GameState():
                 pinDirection = (self.pins[i][2], self.pins[i][3])
                 self.pins.remove(self.pins[i])
                 break
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1)) # only different part from rook
         enemyColor = 'b' if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8): # For each direction, the bishop can move up to 7 squares max
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor: # If there's a piece there, ensure it's an enemy piece
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-                            break
-                        else: # Friendly piece (same color)
-                            break
-                else: # off the board
-                    break
+        rays = RAY_SQUARES[r * 8 + c]
+        for j in BISHOP_DIRECTIONS: # only different part from rook
+            d = DIRECTIONS[j]
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in rays[j]: # precomputed squares up to the edge of the board
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece == "--":
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    elif endPiece[0] == enemyColor: # If there's a piece there, ensure it's an enemy piece
+                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        break
+                    else: # Friendly piece (same color)
+                        break
     '''
     Get all Queen moves fro the rook located at row, col and add these moves to the list
     '''
@@ -492,32 +975,23 @@ class GameState():
     Get all king moves fro the rook located at row, col and add these moves to the list
     '''
     def getKingMoves(self, r, c, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
         allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + rowMoves[i]
-            endCol = c + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    in_check, pins, checks = self.checkForPinsAndChecks()
-                    if not in_check:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        enemyColor = "b" if self.whiteToMove else "w"
+        king = self.board[r][c]
+        self.board[r][c] = "--"  # lift the king so it does not shield the squares behind it from sliders
+        for endRow, endCol in KING_SQUARES[r * 8 + c]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] != allyColor and not self.is_square_attacked(endRow * 8 + endCol, enemyColor):
+                self.board[r][c] = king
+                moves.append(Move((r, c), (endRow, endCol), self.board))
+                self.board[r][c] = "--"
+        self.board[r][c] = king
+
     def getCastleMoves(self, row, col, moves):
         """
         Generate all valid castle moves for the king at (row, col) and add them to the list of moves.
         """
-        if self.squareUnderAttack(row, col):
+        if self.is_square_attacked(row * 8 + col, "b" if self.whiteToMove else "w"):
             return  # can't castle while in check
         if (self.whiteToMove and self.current_castling_rights.wks) or (
                 not self.whiteToMove and self.current_castling_rights.bks):
@@ -528,12 +1002,16 @@ class GameState():
 
     def getKingsideCastleMoves(self, row, col, moves):
         if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--':
-            if not self.squareUnderAttack(row, col + 1) and not self.squareUnderAttack(row, col + 2):
+            enemyColor = "b" if self.whiteToMove else "w"
+            if not self.is_square_attacked(row * 8 + col + 1, enemyColor) and \
+                    not self.is_square_attacked(row * 8 + col + 2, enemyColor):
                 moves.append(Move((row, col), (row, col + 2), self.board, is_castle_move=True))
 
     def getQueensideCastleMoves(self, row, col, moves):
         if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--':
-            if not self.squareUnderAttack(row, col - 1) and not self.squareUnderAttack(row, col - 2):
+            enemyColor = "b" if self.whiteToMove else "w"
+            if not self.is_square_attacked(row * 8 + col - 1, enemyColor) and \
+                    not self.is_square_attacked(row * 8 + col - 2, enemyColor):
                 moves.append(Move((row, col), (row, col - 2), self.board, is_castle_move=True))
 
 
@@ -552,47 +1030,38 @@ class GameState():
             allyColor = "b"
             startRow = self.blackKingLocation[0]
             startCol = self.blackKingLocation[1]
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        rays = RAY_SQUARES[startRow * 8 + startCol]
+        for j in range(len(DIRECTIONS)):
+            d = DIRECTIONS[j]
             possiblePin = ()
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
+            for i, (endRow, endCol) in enumerate(rays[j], 1): # precomputed squares up to the edge of the board
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor and endPiece[1] != 'K':
+                    if possiblePin == ():
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else:
+                        break
+                elif endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    if (0 <= j <= 3 and type == 'R') or \
+                    (4 <= j <= 7 and type == 'B') or \
+                    (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                    (type == 'Q') or (i == 1 and type == 'K'):
                         if possiblePin == ():
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else:
+                            in_check = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        if (0 <= j <= 3 and type == 'R') or \
-                        (4 <= j <= 7 and type == 'B') or \
-                        (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
-                        (type == 'Q') or (i == 1 and type == 'K'):
-                            if possiblePin == ():
-                                in_check = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else: # piece blocking pin
-                                pins.append(possiblePin)
-                                break
-                        else:
+                        else: # piece blocking pin
+                            pins.append(possiblePin)
                             break
-                else:
-                    break # off board
+                    else:
+                        break
         # Check for knight checks
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0<= endCol <8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == 'N':
-                    in_check = True
-                    checks.append((endRow, endCol, m[0], m[1]))
+        for endRow, endCol in KNIGHT_SQUARES[startRow * 8 + startCol]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] == enemyColor and endPiece[1] == 'N':
+                in_check = True
+                checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
         return in_check, pins, checks
 
 class CastleRights:
@@ -603,6 +1072,13 @@ class CastleRights:
         self.bqs = bqs
 
 class Move():
+    """
+    A move packed into a 16 bit moveID: start square (row * 8 + col) in bits 0-5, end square in bits 6-11 and
+    the move kind in bits 12-14 (MOVE_ENPASSANT, MOVE_CASTLE or MOVE_PROMOTION plus the promotion piece index).
+    Next to the id a move only keeps its squares and the pieces it moves and captures, everything else is decoded
+    from the id when asked for.
+    """
+    __slots__ = ("moveID", "startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured")
 
     # maps keys to values
     # key : value
@@ -612,36 +1088,74 @@ class Move():
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
                     "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotionPieces = ("Q", "R", "B", "N")
 
-    def __init__(self, startSq, endSq, board, is_enpassant_move=False, is_castle_move=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # pawn promotion
-        self.is_pawn_promotion = (self.pieceMoved == "wp" and self.endRow == 0) or (
-                self.pieceMoved == "bp" and self.endRow == 7)
-        # en passant
-        self.is_enpassant_move = is_enpassant_move
-        if self.is_enpassant_move:
-            self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
-        # castle move
-        self.is_castle_move = is_castle_move
+    def __init__(self, startSq, endSq, board, is_enpassant_move=False, is_castle_move=False, promotion_piece="Q"):
+        """
+        The kind of move is worked out from the board, so a move built from just two squares (like a mouse click)
+        equals the generated one. is_enpassant_move and is_castle_move are still accepted for the generators.
+        """
+        start_row, start_col = startSq
+        end_row, end_col = endSq
+        self.startRow = start_row
+        self.startCol = start_col
+        self.endRow = end_row
+        self.endCol = end_col
+        piece_moved = board[start_row][start_col]
+        piece_captured = board[end_row][end_col]
+        move_id = start_row << 3 | start_col | end_row << 9 | end_col << 6
+        if piece_moved[1] == "p":
+            if end_row == 0 or end_row == 7:
+                move_id |= MOVE_PROMOTION | self.promotionPieces.index(promotion_piece) << 12
+            elif is_enpassant_move or (start_col != end_col and piece_captured == "--"):
+                move_id |= MOVE_ENPASSANT
+                piece_captured = "wp" if piece_moved == "bp" else "bp"
+        elif is_castle_move or (piece_moved[1] == "K" and (end_col - start_col == 2 or start_col - end_col == 2)):
+            move_id |= MOVE_CASTLE
+        self.pieceMoved = piece_moved
+        self.pieceCaptured = piece_captured
+        self.moveID = move_id
 
-        self.is_capture = self.pieceCaptured != "--"
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+    @classmethod
+    def fromMoveID(cls, move_id, board):
+        """
+        Rebuild a move from its packed id, taking the pieces from board (the position the move is played in).
+        """
+        promotion_piece = cls.promotionPieces[move_id >> 12 & 3] if move_id & MOVE_PROMOTION else "Q"
+        return cls(divmod(move_id & 63, 8), divmod(move_id >> 6 & 63, 8), board, promotion_piece=promotion_piece)
 
+    @property
+    def is_pawn_promotion(self):
+        return self.moveID & MOVE_PROMOTION != 0
+
+    @property
+    def promotionPiece(self):
+        return self.promotionPieces[self.moveID >> 12 & 3] if self.moveID & MOVE_PROMOTION else "Q"
+
+    @property
+    def is_enpassant_move(self):
+        return self.moveID & MOVE_KIND_MASK == MOVE_ENPASSANT
+
+    @property
+    def is_castle_move(self):
+        return self.moveID & MOVE_KIND_MASK == MOVE_CASTLE
+
+    @property
+    def is_capture(self):
+        return self.pieceCaptured != "--"
 
-    '''
-    Overriding the equals method
-    '''
     def __eq__(self, other):
+        """
+        Moves are equal when their packed ids are, a move also equals its id.
+        """
         if isinstance(other, Move):
             return self.moveID == other.moveID
+        if isinstance(other, int):
+            return self.moveID == other
         return False
 
+    def __hash__(self):
+        return self.moveID
 
     # def getChessNotation(self):
     #     # can make it actual chess notation later on
@@ -652,46 +1166,27 @@ class Move():
     #     # actual chess notation is file rank
     #     return self.colsToFiles[c] + self.rowsToRanks[r]
     def getChessNotation(self):
-        if self.is_pawn_promotion:
-            return self.getRankFile(self.endRow, self.endCol) + "Q"
+        """
+        Algebraic notation of the move on its own, e.g. Nf3, exd6, e8=N or O-O. Without the position there is no
+        disambiguation between pieces and no check mark, ChessPGN.moveToSan gives the full SAN.
+        """
         if self.is_castle_move:
-            if self.endCol == 1:
-                return "0-0-0"
-            else:
-                return "0-0"
-        if self.is_enpassant_move:
-            return self.getRankFile(self.startRow, self.startCol)[0] + "x" + self.getRankFile(self.endRow,
-                                                                                                self.endCol) + " e.p."
-        if self.pieceCaptured != "--":
-            if self.pieceMoved[1] == "p":
-                return self.getRankFile(self.startRow, self.startCol)[0] + "x" + self.getRankFile(self.endRow,
-                                                                                                    self.endCol)
-            else:
-                return self.pieceMoved[1] + "x" + self.getRankFile(self.endRow, self.endCol)
-        else:
-            if self.pieceMoved[1] == "p":
-                return self.getRankFile(self.endRow, self.endCol)
-            else:
-                return self.pieceMoved[1] + self.getRankFile(self.endRow, self.endCol)
-
-        # TODO Disambiguating moves
+            return "O-O" if self.endCol == 6 else "O-O-O"
+        end_square = self.getRankFile(self.endRow, self.endCol)
+        if self.pieceMoved[1] == "p":
+            move_string = self.colsToFiles[self.startCol] + "x" + end_square if self.is_capture else end_square
+            return move_string + "=" + self.promotionPiece if self.is_pawn_promotion else move_string
+        return self.pieceMoved[1] + ("x" if self.is_capture else "") + end_square
 
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
 
-    def __str__(self):
-        if self.is_castle_move:
-            return "0-0" if self.endCol == 6 else "0-0-0"
-
-        end_square = self.getRankFile(self.endRow, self.endCol)
-
-        if self.pieceMoved[1] == "p":
-            if self.is_capture:
-                return self.colsToFiles[self.startCol] + "x" + end_square
-            else:
-                return end_square + "Q" if self.is_pawn_promotion else end_square
+    def getUciNotation(self):
+        """
+        Long algebraic notation as used by UCI, e.g. e2e4, e1g1 for castling and e7e8q for a promotion.
+        """
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        return notation + self.promotionPiece.lower() if self.is_pawn_promotion else notation
 
-        move_string = self.pieceMoved[1]
-        if self.is_capture:
-            move_string += "x"
-        return move_string + end_square
\ No newline at end of file
+    def __str__(self):
+        return self.getChessNotation()
\ No newline at end of file
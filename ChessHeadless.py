@@ -0,0 +1,114 @@
+"""
+Headless chess engine.
+Wraps a GameState and ChessAI.findBestMove behind a small API that never touches pygame, for running the engine
+server-side, from scripts or behind the UCI front end in ChessUCI.
+"""
+import queue
+
+import ChessAI
+import ChessBitboard
+import ChessEngine
+from ChessMoveOrdering import MoveOrderer
+from ChessParallel import ParallelSearch
+
+
+class Engine:
+    def __init__(self, bitboards=False, workers=1):
+        self.bitboards = bitboards  # keep the position in a BitboardState instead of a GameState
+        self.game_state = None
+        self.parallel_search = None
+        self.setWorkers(workers)
+        self.newGame()
+
+    def setWorkers(self, workers):
+        """
+        Search in this process when workers is 1, otherwise split the root moves over that many worker processes.
+        """
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
+        if workers > 1:
+            self.parallel_search = ParallelSearch(workers)
+
+    def close(self):
+        """
+        Shut down the worker processes, if any.
+        """
+        self.setWorkers(1)
+
+    def newGame(self):
+        """
+        Back to the starting position, forgetting everything the search learned in earlier games.
+        """
+        self.game_state = ChessBitboard.BitboardState() if self.bitboards else ChessEngine.GameState()
+        ChessAI.transposition_table.clear()
+        ChessAI.move_orderer = MoveOrderer()
+        if self.parallel_search is not None:
+            self.parallel_search.newGame()
+
+    def setPosition(self, moves=(), fen=None):
+        """
+        Set up fen (the starting position if None) followed by moves, given in UCI notation.
+        Raises ValueError for a bad FEN or an illegal move.
+        """
+        self.game_state = ChessBitboard.BitboardState() if self.bitboards else ChessEngine.GameState()
+        if fen is not None:
+            self.game_state.loadFen(fen)
+        for move in moves:
+            self.makeMove(move)
+
+    def validMoves(self):
+        return self.game_state.getValidMoves()
+
+    def findMove(self, uci_move):
+        """
+        The valid move written as uci_move, or None if there is no such move.
+        """
+        uci_move = uci_move.lower()
+        for move in self.validMoves():
+            if move.getUciNotation() == uci_move:
+                return move
+        return None
+
+    def makeMove(self, uci_move):
+        """
+        Play a move given in UCI notation. Raises ValueError if it is not a valid move in the current position.
+        """
+        move = self.findMove(uci_move)
+        if move is None:
+            raise ValueError("illegal move %r" % uci_move)
+        self.game_state.makeMove(move)
+        return move
+
+    def result(self):
+        """
+        "1-0", "0-1" or "1/2-1/2" once the game is over, by checkmate, stalemate, threefold repetition or the
+        fifty-move rule, None while it is still going.
+        """
+        if not self.validMoves():
+            if self.game_state.checkmate:
+                return "0-1" if self.game_state.whiteToMove else "1-0"
+            return "1/2-1/2"
+        if self.game_state.isDraw():
+            return "1/2-1/2"
+        return None
+
+    def search(self, max_depth=None, time_limit=None, node_limit=None, stop_event=None, info_callback=None,
+               stats=None):
+        """
+        Search the current position and return the best move found, None if the game is over.
+        The limits, info_callback and stats are those of ChessAI.findBestMove. stats is not filled in by a search
+        split over worker processes.
+        """
+        valid_moves = self.validMoves()
+        if not valid_moves:
+            return None
+        if self.parallel_search is not None:
+            return self.parallel_search.search(self.game_state, valid_moves, max_depth=max_depth,
+                                               time_limit=time_limit, node_limit=node_limit, stop_event=stop_event,
+                                               info_callback=info_callback)
+        return_queue = queue.Queue()
+        ChessAI.findBestMove(self.game_state, valid_moves, return_queue, max_depth=max_depth, time_limit=time_limit,
+                             node_limit=node_limit, stop_event=stop_event, info_callback=info_callback, stats=stats)
+        return return_queue.get()
+
@@ -4,9 +4,8 @@ Handling user input.
 Displaying current GameStatus object.
 """
 import pygame as p
-import ChessEngine, ChessAI
+import ChessEngine, ChessAI, ChessPGN, ChessWorker
 import sys
-from multiprocessing import Process, Queue
 
 BOARD_WIDTH = BOARD_HEIGHT = 512
 moveLog_PANEL_WIDTH = 250
@@ -38,6 +37,7 @@ def main():
     screen.fill(p.Color("white"))
     game_state = ChessEngine.GameState()
     valid_moves = game_state.getValidMoves()
+    san_log = []  # the moves played in SAN, for the move log
     move_made = False  # flag variable for when a move is made
     animate = False  # flag variable for when we should animate a move
     loadImages()  # do this only once before while loop
@@ -47,7 +47,7 @@ def main():
     game_over = False
     ai_thinking = False
     move_undone = False
-    move_finder_process = None
+    search_worker = ChessWorker.SearchWorker()  # keeps its caches between moves
     moveLog_font = p.font.SysFont("Arial", 14, False, False)
     player_one = True  # if a human is playing white, then this will be True, else False
     player_two = False  # if a hyman is playing white, then this will be True, else False
@@ -56,6 +56,7 @@ def main():
         human_turn = (game_state.whiteToMove and player_one) or (not game_state.whiteToMove and player_two)
         for e in p.event.get():
             if e.type == p.QUIT:
+                search_worker.close()
                 p.quit()
                 sys.exit()
             # mouse handler
@@ -74,6 +75,7 @@ def main():
                         move = ChessEngine.Move(player_clicks[0], player_clicks[1], game_state.board)
                         for i in range(len(valid_moves)):
                             if move == valid_moves[i]:
+                                san_log.append(ChessPGN.moveToSan(game_state, valid_moves[i], valid_moves))
                                 game_state.makeMove(valid_moves[i])
                                 move_made = True
                                 animate = True
@@ -86,23 +88,25 @@ def main():
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:  # undo when 'z' is pressed
                     game_state.undoMove()
+                    del san_log[len(game_state.moveLog):]
                     move_made = True
                     animate = False
                     game_over = False
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        search_worker.cancel()
                         ai_thinking = False
                     move_undone = True
                 if e.key == p.K_r:  # reset the game when 'r' is pressed
                     game_state = ChessEngine.GameState()
                     valid_moves = game_state.getValidMoves()
+                    san_log = []
                     square_selected = ()
                     player_clicks = []
                     move_made = False
                     animate = False
                     game_over = False
                     if ai_thinking:
-                        move_finder_process.terminate()
+                        search_worker.cancel()
                         ai_thinking = False
                     move_undone = True
 
@@ -110,14 +114,17 @@ def main():
         if not game_over and not human_turn and not move_undone:
             if not ai_thinking:
                 ai_thinking = True
-                return_queue = Queue()  # used to pass data between threads
-                move_finder_process = Process(target=ChessAI.findBestMove, args=(game_state, valid_moves, return_queue))
-                move_finder_process.start()
-
-            if not move_finder_process.is_alive():
-                ai_move = return_queue.get()
+                search_worker.search(game_state)
+
+            finished, ai_move_id = search_worker.poll()
+            if finished:
+                ai_move = None
+                for move in valid_moves:
+                    if move.moveID == ai_move_id:
+                        ai_move = move
                 if ai_move is None:
                     ai_move = ChessAI.findRandomMove(valid_moves)
+                san_log.append(ChessPGN.moveToSan(game_state, ai_move, valid_moves))
                 game_state.makeMove(ai_move)
                 move_made = True
                 animate = True
@@ -134,7 +141,7 @@ def main():
         drawGameState(screen, game_state, valid_moves, square_selected)
 
         if not game_over:
-            drawMoveLog(screen, game_state, moveLog_font)
+            drawMoveLog(screen, san_log, moveLog_font)
 
         if game_state.checkmate:
             game_over = True
@@ -147,6 +154,14 @@ def main():
             game_over = True
             drawEndGameText(screen, "Stalemate")
 
+        elif game_state.isThreefoldRepetition():
+            game_over = True
+            drawEndGameText(screen, "Draw by threefold repetition")
+
+        elif game_state.isFiftyMoveDraw():
+            game_over = True
+            drawEndGameText(screen, "Draw by fifty-move rule")
+
         clock.tick(MAX_FPS)
         p.display.flip()
 
@@ -210,19 +225,18 @@ def drawPieces(screen, board):
                 screen.blit(IMAGES[piece], p.Rect(column * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
 
 
-def drawMoveLog(screen, game_state, font):
+def drawMoveLog(screen, san_log, font):
     """
-    Draws the move log.
+    Draws the move log, given in SAN.
 
     """
     moveLog_rect = p.Rect(BOARD_WIDTH, 0, moveLog_PANEL_WIDTH, moveLog_PANEL_HEIGHT)
     p.draw.rect(screen, p.Color('black'), moveLog_rect)
-    moveLog = game_state.moveLog
     move_texts = []
-    for i in range(0, len(moveLog), 2):
-        move_string = str(i // 2 + 1) + '. ' + str(moveLog[i]) + " "
-        if i + 1 < len(moveLog):
-            move_string += str(moveLog[i + 1]) + "  "
+    for i in range(0, len(san_log), 2):
+        move_string = str(i // 2 + 1) + '. ' + san_log[i] + " "
+        if i + 1 < len(san_log):
+            move_string += san_log[i + 1] + "  "
         move_texts.append(move_string)
 
     moves_per_row = 3
@@ -0,0 +1,112 @@
+"""
+Move ordering for the alpha-beta search.
+Moves are tried in stages: the hash (transposition table / PV) move, captures and promotions by MVV-LVA,
+the killer moves of the ply and finally the quiet moves by history heuristic score.
+"""
+from ChessEngine import MOVE_PROMOTION
+
+# piece values for MVV-LVA, the king only ever shows up as the attacker
+MVV_LVA_VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 10}
+
+HASH_MOVE_STAGE = 0
+CAPTURE_STAGE = 1
+KILLER_STAGE = 2
+QUIET_STAGE = 3
+
+KILLERS_PER_PLY = 2
+MAX_PLY = 64
+
+
+class MoveOrderer:
+    def __init__(self):
+        self.killers = [[None] * KILLERS_PER_PLY for ply in range(MAX_PLY)]
+        self.history = [0] * (64 * 64)  # indexed by start square * 64 + end square
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def newSearch(self):
+        """
+        Forget the killers of the last search and age the history scores so recent cutoffs count the most.
+        """
+        self.killers = [[None] * KILLERS_PER_PLY for ply in range(MAX_PLY)]
+        self.history = [score // 2 for score in self.history]
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def orderMoves(self, moves, ply=None, hash_move_id=None):
+        """
+        Return moves sorted by stage and by score inside each stage. The sort is stable, so ties keep their order.
+        Killers are only used when ply is given.
+        """
+        return sorted(moves, key=self._sortKey(ply, hash_move_id))
+
+    def stagedMoves(self, game_state, ply=None, hash_move_id=None):
+        """
+        Generator of the legal moves of game_state in the order orderMoves would give them, built in stages:
+        the hash move on its own, then the captures and promotions, then the quiet moves (killers first).
+        A stage is only generated once the one before is used up and a move's legality is only checked right
+        before it is yielded, so a search that cuts off early never pays for the moves it did not try.
+        game_state may be changed between moves as long as it is back in the same position when asked for more.
+        """
+        if hash_move_id is not None:
+            hash_move = game_state.getLegalMove(hash_move_id)
+            if hash_move is not None:
+                yield hash_move
+        sort_key = self._sortKey(ply, hash_move_id)
+        for captures in (True, False):
+            moves, is_legal = game_state.getPseudoLegalMoves(captures)
+            moves.sort(key=sort_key)
+            for move in moves:
+                if move.moveID != hash_move_id and (is_legal is None or is_legal(move)):
+                    yield move
+
+    def _sortKey(self, ply, hash_move_id):
+        killers = self.killers[ply] if ply is not None and ply < MAX_PLY else ()
+        history = self.history
+
+        def sortKey(move):
+            if move.moveID == hash_move_id:
+                return HASH_MOVE_STAGE, 0
+            promotion = move.moveID & MOVE_PROMOTION
+            if move.pieceCaptured != "--" or promotion:
+                victim = MVV_LVA_VALUES[move.pieceCaptured[1]] if move.pieceCaptured != "--" else 0
+                if promotion:
+                    victim += MVV_LVA_VALUES[move.promotionPiece]
+                return CAPTURE_STAGE, MVV_LVA_VALUES[move.pieceMoved[1]] - 10 * victim
+            if move.moveID in killers:
+                return KILLER_STAGE, 0
+            return QUIET_STAGE, -history[historyIndex(move)]
+
+        return sortKey
+
+    def recordCutoff(self, move, ply, depth, move_number):
+        """
+        Remember a move that caused a beta cutoff. move_number is its position in the ordered list.
+        Quiet moves become killers of the ply and gain history score.
+        """
+        self.cutoffs += 1
+        if move_number == 0:
+            self.first_move_cutoffs += 1
+        if move.is_capture or move.is_pawn_promotion:
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers[1] = killers[0]
+                killers[0] = move.moveID
+        self.history[historyIndex(move)] += depth * depth
+
+    def firstMoveCutoffRate(self):
+        """
+        Fraction of beta cutoffs that came from the first move searched, the closer to 1 the better the ordering.
+        """
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def stats(self):
+        return {"cutoffs": self.cutoffs,
+                "first_move_cutoffs": self.first_move_cutoffs,
+                "first_move_cutoff_rate": self.firstMoveCutoffRate()}
+
+
+def historyIndex(move):
+    return (move.startRow * 8 + move.startCol) * 64 + move.endRow * 8 + move.endCol
@@ -0,0 +1,322 @@
+"""
+PGN reading and writing.
+Moves are written in standard algebraic notation (SAN), worked out against the valid moves of the position so pieces
+are disambiguated and checks and mates are marked, and SAN is read back by matching it against the valid moves.
+readGames goes through a PGN stream line by line and yields one game at a time, so an archive of any size is read in
+the memory of a single game. PgnWriter appends games to a stream one at a time.
+
+python ChessPGN.py games.pgn [--limit N]        replay every game and report the ones that do not parse
+"""
+import argparse
+import re
+import sys
+import time
+
+import ChessEngine
+from ChessEngine import Move
+
+# the seven tag roster, written first and in this order
+ROSTER_TAGS = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+LINE_LENGTH = 80
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# comments, variations, NAGs, move numbers and results, anything else is a move
+TOKEN_PATTERN = re.compile(r"\{|;|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{};()$]+")
+SAN_PATTERN = re.compile(r"([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?")
+CASTLES = {"O-O": 6, "0-0": 6, "O-O-O": 2, "0-0-0": 2}
+
+
+class PgnGame:
+    def __init__(self, tags=None, san_moves=None, result="*"):
+        self.tags = tags if tags is not None else {}
+        self.san_moves = san_moves if san_moves is not None else []
+        self.result = result
+
+    @classmethod
+    def fromMoves(cls, moves, tags=None, result="*", fen=None):
+        """
+        The game of moves (Move objects) played from fen, the starting position if None.
+        """
+        game = cls(dict(tags or {}), [], result)
+        if fen is not None:
+            game.tags["SetUp"] = "1"
+            game.tags["FEN"] = fen
+        game_state = game.startingState()
+        for move in moves:
+            game.san_moves.append(moveToSan(game_state, move))
+            game_state.makeMove(move)
+        return game
+
+    def startingState(self):
+        """
+        A new GameState at the position of the FEN tag, the starting position without one.
+        """
+        game_state = ChessEngine.GameState()
+        if "FEN" in self.tags:
+            game_state.loadFen(self.tags["FEN"])
+        return game_state
+
+    def replay(self):
+        """
+        Generate (game_state, move) for every move of the game, game_state being the position the move is played
+        in. The move is made on the same GameState once the consumer asks for the next one.
+        Raises ValueError at the first move that does not parse or is not legal.
+        """
+        game_state = self.startingState()
+        for san in self.san_moves:
+            try:
+                move = sanToMove(game_state, san)
+            except ValueError as error:
+                raise ValueError("move %d%s %s: %s" % (game_state.fullmove_number,
+                                                       "." if game_state.whiteToMove else "...", san, error))
+            yield game_state, move
+            game_state.makeMove(move)
+
+    def moves(self):
+        return [move for game_state, move in self.replay()]
+
+    def toPgn(self):
+        tags = dict(self.tags)
+        tags["Result"] = self.result
+        lines = ['[%s "%s"]' % (name, escapeTag(tags.get(name, "?"))) for name in ROSTER_TAGS]
+        lines += ['[%s "%s"]' % (name, escapeTag(value)) for name, value in tags.items() if name not in ROSTER_TAGS]
+        game_state = self.startingState()
+        movetext = formatMovetext(self.san_moves, self.result, game_state.whiteToMove, game_state.fullmove_number)
+        return "\n".join(lines) + "\n\n" + movetext + "\n"
+
+
+class PgnWriter:
+    """
+    Writes games to a text stream one at a time, flushing after each so a reader sees every finished game.
+    """
+    def __init__(self, out):
+        self.out = out
+        self.games = 0
+
+    def write(self, game):
+        self.out.write(game.toPgn() + "\n")
+        self.out.flush()
+        self.games += 1
+
+    def writeMoves(self, moves, tags=None, result="*", fen=None):
+        self.write(PgnGame.fromMoves(moves, tags, result, fen))
+
+
+def moveToSan(game_state, move, valid_moves=None):
+    """
+    The SAN of move, a valid move of game_state, e.g. Nbd7, exd6, e8=Q+ or O-O-O#.
+    """
+    if valid_moves is None:
+        valid_moves = game_state.getValidMoves()
+    piece = move.pieceMoved[1]
+    if move.is_castle_move:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    elif piece == "p":
+        san = Move.colsToFiles[move.startCol] + "x" if move.is_capture else ""
+        san += move.getRankFile(move.endRow, move.endCol)
+        if move.is_pawn_promotion:
+            san += "=" + move.promotionPiece
+    else:
+        rivals = [other for other in valid_moves
+                  if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and other.endCol == move.endCol
+                  and (other.startRow != move.startRow or other.startCol != move.startCol)]
+        san = piece
+        if rivals:
+            if all(other.startCol != move.startCol for other in rivals):
+                san += Move.colsToFiles[move.startCol]
+            elif all(other.startRow != move.startRow for other in rivals):
+                san += Move.rowsToRanks[move.startRow]
+            else:
+                san += move.getRankFile(move.startRow, move.startCol)
+        san += ("x" if move.is_capture else "") + move.getRankFile(move.endRow, move.endCol)
+    game_state.makeMove(move)
+    if game_state.inCheck():
+        san += "+" if game_state.getValidMoves() else "#"
+    game_state.undoMove()
+    return san
+
+
+def sanToMove(game_state, san, valid_moves=None):
+    """
+    The valid move of game_state written as san. Check marks, annotations like ! and ?, a missing = before the
+    promotion piece and castling written with zeros are accepted.
+    Raises ValueError if san is malformed, illegal or ambiguous.
+    """
+    if valid_moves is None:
+        valid_moves = game_state.getValidMoves()
+    text = san.rstrip("+#!?")
+    if text.endswith("e.p."):
+        text = text[:-4]
+    if text in CASTLES:
+        end_col = CASTLES[text]
+        candidates = [move for move in valid_moves if move.is_castle_move and move.endCol == end_col]
+    else:
+        match = SAN_PATTERN.fullmatch(text)
+        if match is None:
+            raise ValueError("not a move in SAN")
+        piece, start_file, start_rank, target, promotion = match.groups()
+        piece = piece or "p"
+        end_row, end_col = Move.ranksToRows[target[1]], Move.filesToCols[target[0]]
+        candidates = [move for move in valid_moves
+                      if move.pieceMoved[1] == piece and move.endRow == end_row and move.endCol == end_col
+                      and (start_file is None or move.startCol == Move.filesToCols[start_file])
+                      and (start_rank is None or move.startRow == Move.ranksToRows[start_rank])
+                      and (move.promotionPiece == promotion if move.is_pawn_promotion else promotion is None)]
+    if not candidates:
+        raise ValueError("illegal move")
+    if len(candidates) > 1:
+        raise ValueError("ambiguous move")
+    return candidates[0]
+
+
+def readGames(stream):
+    """
+    Generate the games of a PGN text stream as PgnGame objects, reading it one line at a time.
+    Comments, NAGs and variations are skipped. The moves are kept as SAN, so a game is only checked for legal moves
+    when it is replayed.
+    """
+    game = None
+    in_movetext = False
+    in_comment = False
+    variation_depth = 0
+    for line in stream:
+        if in_comment:
+            end = line.find("}")
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        elif line.startswith("%"):
+            continue  # escape line
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith("[") and variation_depth == 0:
+            tag = TAG_PATTERN.match(stripped)
+            if tag is not None:
+                if game is not None and in_movetext:  # the previous game had no result at the end
+                    game.result = game.tags.get("Result", "*")
+                    yield game
+                    game = None
+                if game is None:
+                    game = PgnGame()
+                    in_movetext = False
+                game.tags[tag.group(1)] = unescapeTag(tag.group(2))
+                continue
+        if game is None:
+            game = PgnGame()
+        in_movetext = True
+        position = 0
+        while True:
+            token = TOKEN_PATTERN.search(line, position)
+            if token is None:
+                break
+            position = token.end()
+            token = token.group()
+            if token == "{":
+                end = line.find("}", position)
+                if end < 0:
+                    in_comment = True
+                    break
+                position = end + 1
+                continue
+            if token == ";":
+                break
+            if token == "(":
+                variation_depth += 1
+            elif token == ")":
+                variation_depth = max(0, variation_depth - 1)
+            elif variation_depth or token[0] == "$" or token[0].isdigit() and token.endswith("."):
+                continue
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game = None
+                in_movetext = False
+                variation_depth = 0
+                break
+            else:
+                game.san_moves.append(token)
+    if game is not None and (game.tags or game.san_moves):
+        game.result = game.tags.get("Result", "*")
+        yield game
+
+
+def readPgnFile(path):
+    """
+    Generate the games of the PGN file at path, see readGames.
+    """
+    with open(path, encoding="utf-8", errors="replace") as pgn_file:
+        yield from readGames(pgn_file)
+
+
+def formatMovetext(san_moves, result="*", white_to_move=True, first_move_number=1):
+    """
+    Number the SAN moves and wrap them into lines of at most LINE_LENGTH characters, ending with result.
+    """
+    tokens = []
+    move_number = first_move_number
+    for index, san in enumerate(san_moves):
+        if white_to_move:
+            tokens.append("%d." % move_number)
+        elif index == 0:
+            tokens.append("%d..." % move_number)
+        tokens.append(san)
+        if not white_to_move:
+            move_number += 1
+        white_to_move = not white_to_move
+    tokens.append(result)
+    lines = []
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def gameToPgn(moves, tags=None, result="*", fen=None):
+    """
+    The PGN text of a game: moves (Move objects) played from fen, the starting position if None.
+    tags are added to the seven tag roster, which is filled with "?" where tags leaves it out.
+    """
+    return PgnGame.fromMoves(moves, tags, result, fen).toPgn()
+
+
+def escapeTag(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def unescapeTag(value):
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the games of a PGN file and check every move.")
+    parser.add_argument("path")
+    parser.add_argument("--limit", type=int, help="stop after this many games")
+    args = parser.parse_args(argv)
+
+    games = plies = errors = 0
+    start = time.perf_counter()
+    for game in readPgnFile(args.path):
+        if args.limit is not None and games >= args.limit:
+            break
+        games += 1
+        try:
+            for game_state, move in game.replay():
+                plies += 1
+        except ValueError as error:
+            errors += 1
+            print("game %d (%s - %s): %s" % (games, game.tags.get("White", "?"), game.tags.get("Black", "?"), error))
+    elapsed = time.perf_counter() - start
+    print("%d games, %d plies, %d with errors in %.1fs (%.0f games/s)"
+          % (games, plies, errors, elapsed, games / elapsed if elapsed > 0 else 0))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Parallel root search.
+The root moves are dealt out over a pool of long-lived worker processes. Each worker searches its share of the moves
+with ChessAI.findBestMove on its own copy of the GameState and with its own transposition table and history scores,
+reporting every depth it completes. A depth counts once every worker still searching has completed it, and its best
+move is the best of the workers' best moves. A worker that has finished stands by its deepest result from then on.
+"""
+import os
+import queue
+from multiprocessing import Process, Queue, Value
+
+import ChessAI
+from ChessMoveOrdering import MoveOrderer
+from ChessWorker import CancelFlag
+
+POLL_INTERVAL = 0.05  # seconds between checks of the caller's stop_event while waiting for the workers
+
+
+class ParallelSearch:
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.results = Queue()
+        self.cancelled_id = Value("i", 0)  # every request up to this id is cancelled
+        self.requests = [Queue() for worker in range(self.workers)]
+        self.processes = [Process(target=workerLoop, args=(index, requests, self.results, self.cancelled_id),
+                                  daemon=True)
+                          for index, requests in enumerate(self.requests)]
+        for process in self.processes:
+            process.start()
+        self.request_id = 0
+
+    def search(self, game_state, valid_moves=None, max_depth=None, time_limit=None, node_limit=None,
+               stop_event=None, info_callback=None):
+        """
+        Search game_state on all workers and return the best move, None if there are no valid moves.
+        The limits and info_callback are those of ChessAI.findBestMove, node_limit being shared out over the
+        workers and nodes in info_callback being the total of all workers.
+        Raises RuntimeError if a worker process dies, after terminating the others.
+        """
+        if valid_moves is None:
+            valid_moves = game_state.getValidMoves()
+        if not valid_moves:
+            return None
+        # book and tablebase moves are looked up here, the workers only see part of the moves
+        known_move = ChessAI.findBookMove(game_state, valid_moves)
+        if known_move is None:
+            known_move = ChessAI.findTablebaseMove(game_state, valid_moves)
+        if known_move is not None:
+            return known_move
+        moves_by_id = {move.moveID: move for move in valid_moves}
+        # deal the moves out in order so every worker gets a share of the promising ones
+        ordered = ChessAI.move_orderer.orderMoves(valid_moves)
+        shares = [ordered[index::self.workers] for index in range(min(self.workers, len(ordered)))]
+        if node_limit is not None:
+            node_limit = max(1, node_limit // len(shares))
+        limits = {"max_depth": max_depth, "time_limit": time_limit, "node_limit": node_limit}
+        self.request_id += 1
+        for index, share in enumerate(shares):
+            self.requests[index].put(("search", self.request_id, game_state, [move.moveID for move in share], limits))
+
+        completed = [{} for share in shares]  # per worker: depth -> (score, move id)
+        finished = [False] * len(shares)
+        nodes_searched = [0] * len(shares)
+        reported_depth = 0
+        best_move_id = None
+        running = len(shares)
+        while running:
+            if stop_event is not None and stop_event.is_set():
+                self.cancel()
+            try:
+                message = self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    self.terminate()
+                    raise RuntimeError("a search worker process died")
+                continue
+            if message[1] != self.request_id:
+                continue  # left over from a cancelled request
+            if message[0] == "done":
+                running -= 1
+                finished[message[2]] = True
+            else:
+                _, _, index, depth, score, move_id, nodes = message
+                completed[index][depth] = (score, move_id)
+                nodes_searched[index] = nodes
+            results = depthResults(completed, finished, reported_depth + 1)
+            while results is not None:
+                reported_depth += 1
+                score, best_move_id = max(results, key=lambda result: result[0])
+                if info_callback is not None:
+                    info_callback(reported_depth, score, moves_by_id[best_move_id], sum(nodes_searched))
+                results = depthResults(completed, finished, reported_depth + 1)
+        if best_move_id is None:  # cancelled before any worker got going
+            return ordered[0]
+        return moves_by_id[best_move_id]
+
+    def newGame(self):
+        """
+        Make every worker forget what its searches learned so far.
+        """
+        for requests in self.requests:
+            requests.put(("newgame",))
+
+    def cancel(self):
+        """
+        Stop the running search. The workers report the depths they completed and stay alive.
+        """
+        self.cancelled_id.value = self.request_id
+
+    def terminate(self):
+        """
+        Kill every worker without waiting for it, leaving the search unusable.
+        """
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+
+    def close(self):
+        self.cancel()
+        for requests in self.requests:
+            requests.put(("quit",))
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+
+def depthResults(completed, finished, depth):
+    """
+    The (score, move id) of every worker at depth, None until at least one worker and every worker still searching
+    have completed it. A finished worker short of depth stands by its deepest result, one without any is left out.
+    """
+    if not any(depth in depths for depths in completed):
+        return None
+    results = []
+    for depths, done in zip(completed, finished):
+        if depth in depths:
+            results.append(depths[depth])
+        elif not done:
+            return None
+        elif depths:
+            results.append(depths[max(depths)])
+    return results
+
+
+def workerLoop(index, requests, results, cancelled_id):
+    while True:
+        message = requests.get()
+        if message[0] == "quit":
+            break
+        if message[0] == "newgame":
+            ChessAI.transposition_table.clear()
+            ChessAI.move_orderer = MoveOrderer()
+            continue
+        _, request_id, game_state, move_ids, limits = message
+        cancel_flag = CancelFlag(cancelled_id, request_id)
+        if not cancel_flag.is_set():
+            moves = [move for move in game_state.getValidMoves() if move.moveID in move_ids]
+
+            def report(depth, score, move, nodes):
+                results.put(("depth", request_id, index, depth, score, move.moveID, nodes))
+
+            ChessAI.findBestMove(game_state, moves, queue.Queue(), stop_event=cancel_flag, info_callback=report,
+                                 use_book=False, use_tablebases=False, **limits)
+        results.put(("done", request_id, index))
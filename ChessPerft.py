@@ -0,0 +1,172 @@
+"""
+Perft (performance test) for the move generator.
+perft counts the leaf nodes of the legal move tree to a fixed depth, which are compared against published counts.
+The suite covers the usual test positions plus en passant, castling and promotion edge cases.
+
+python ChessPerft.py 4                        nodes of the starting position at depth 4
+python ChessPerft.py 3 --position kiwipete --divide
+python ChessPerft.py 5 --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"
+python ChessPerft.py --suite --max-depth 4 --bitboards
+"""
+import argparse
+import sys
+import time
+
+import ChessBitboard
+import ChessEngine
+
+PERFT_SUITE = [
+    {"name": "start", "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     "nodes": {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}},
+    {"name": "kiwipete", "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     "nodes": {1: 48, 2: 2039, 3: 97862, 4: 4085603}},
+    {"name": "position3", "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     "nodes": {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}},
+    {"name": "position4", "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     "nodes": {1: 6, 2: 264, 3: 9467, 4: 422333}},
+    {"name": "position5", "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 0 1",
+     "nodes": {1: 44, 2: 1486, 3: 62379, 4: 2103487}},
+    {"name": "position6", "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 1",
+     "nodes": {1: 46, 2: 2079, 3: 89890, 4: 3894594}},
+    {"name": "illegal en passant 1", "fen": "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     "nodes": {6: 1134888}},
+    {"name": "illegal en passant 2", "fen": "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     "nodes": {6: 1015133}},
+    {"name": "en passant capture checks", "fen": "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     "nodes": {6: 1440467}},
+    {"name": "short castling gives check", "fen": "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     "nodes": {6: 661072}},
+    {"name": "long castling gives check", "fen": "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     "nodes": {6: 803711}},
+    {"name": "castling rights", "fen": "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     "nodes": {4: 1274206}},
+    {"name": "castling prevented", "fen": "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     "nodes": {4: 1720476}},
+    {"name": "promote out of check", "fen": "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     "nodes": {6: 3821001}},
+    {"name": "discovered check", "fen": "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     "nodes": {5: 1004658}},
+    {"name": "promote to give check", "fen": "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     "nodes": {6: 217342}},
+    {"name": "underpromote to check", "fen": "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     "nodes": {6: 92683}},
+    {"name": "self stalemate", "fen": "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     "nodes": {6: 2217}},
+    {"name": "stalemate and checkmate 1", "fen": "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     "nodes": {7: 567584}},
+    {"name": "stalemate and checkmate 2", "fen": "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     "nodes": {4: 23527}}
+]
+
+
+def perft(game_state, depth):
+    """
+    Number of leaf nodes depth plies below game_state. The last ply is counted without making the moves.
+    """
+    moves = game_state.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        game_state.makeMove(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.undoMove()
+    return nodes
+
+
+def divide(game_state, depth):
+    """
+    Perft split by root move, as a list of (move, nodes). Handy for finding which move a wrong count comes from.
+    """
+    result = []
+    for move in game_state.getValidMoves():
+        game_state.makeMove(move)
+        result.append((move, perft(game_state, depth - 1)))
+        game_state.undoMove()
+    return result
+
+
+def suitePosition(entry, bitboards=False):
+    """
+    Build the GameState (or BitboardState) of a suite entry.
+    """
+    return loadPosition(entry["fen"], bitboards)
+
+
+def loadPosition(fen, bitboards=False):
+    game_state = ChessBitboard.BitboardState() if bitboards else ChessEngine.GameState()
+    game_state.loadFen(fen)
+    return game_state
+
+
+def runSuite(max_depth=None, bitboards=False, out=sys.stdout):
+    """
+    Check every suite count up to max_depth. Returns the number of mismatches.
+    """
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for entry in PERFT_SUITE:
+        for depth, expected in sorted(entry["nodes"].items()):
+            if max_depth is not None and depth > max_depth:
+                continue
+            game_state = suitePosition(entry, bitboards)
+            start = time.perf_counter()
+            nodes = perft(game_state, depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else "FAIL (expected %d)" % expected
+            failures += nodes != expected
+            print("%-28s depth %d %10d nodes %8.2fs %9.0f nps  %s"
+                  % (entry["name"], depth, nodes, elapsed, nodes / elapsed if elapsed else 0, status), file=out)
+    print("%d nodes in %.2fs, %.0f nps, %d failed"
+          % (total_nodes, total_time, total_nodes / total_time if total_time else 0, failures), file=out)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count move generator leaf nodes and check them against the suite.")
+    parser.add_argument("depth", type=int, nargs="?", default=3)
+    parser.add_argument("--position", default="start", help="name of a suite position")
+    parser.add_argument("--fen", help="count the moves of this position instead of a suite one")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--suite", action="store_true", help="run every suite position against its known counts")
+    parser.add_argument("--max-depth", type=int, help="skip suite counts deeper than this")
+    parser.add_argument("--bitboards", action="store_true", help="use the bitboard move generator")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        return 1 if runSuite(args.max_depth, args.bitboards) else 0
+
+    if args.fen is not None:
+        entry = {"name": "fen", "fen": args.fen, "nodes": {}}
+    else:
+        entries = [entry for entry in PERFT_SUITE if entry["name"] == args.position]
+        if not entries:
+            parser.error("unknown position %r, choose from: %s"
+                         % (args.position, ", ".join(entry["name"] for entry in PERFT_SUITE)))
+        entry = entries[0]
+    try:
+        game_state = suitePosition(entry, args.bitboards)
+    except ValueError as error:
+        parser.error(str(error))
+    start = time.perf_counter()
+    if args.divide:
+        split = divide(game_state, args.depth)
+        for move, nodes in split:
+            print("%s: %d" % (move.getChessNotation(), nodes))
+        nodes = sum(nodes for move, nodes in split)
+    else:
+        nodes = perft(game_state, args.depth)
+    elapsed = time.perf_counter() - start
+    print("depth %d: %d nodes in %.2fs (%.0f nps)" % (args.depth, nodes, elapsed, nodes / elapsed if elapsed else 0))
+    expected = entry["nodes"].get(args.depth)
+    if expected is not None and expected != nodes:
+        print("expected %d" % expected)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
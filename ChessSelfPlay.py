@@ -0,0 +1,295 @@
+"""
+Self-play matches.
+Two engine configurations play each other over a pool of worker processes. Games come in pairs that start from the
+same randomised opening with colours swapped, so an unbalanced opening cancels out. Every finished game is appended
+to the JSONL and PGN outputs straight away, and the match ends with the Elo difference and the games per hour.
+
+A configuration is a list of key=value settings: name, depth, time (seconds per move) and nodes set the search
+limits, and any ChessAI constant in capitals, like PIECE_SQUARE_WEIGHT=0 or USE_BITBOARDS=True, is set for that side.
+
+python ChessSelfPlay.py --games 100 --first depth=3 --second depth=2
+python ChessSelfPlay.py --games 40 --first "name=psqt time=0.2" --second "name=material time=0.2 PIECE_SQUARE_WEIGHT=0"
+    --processes 4 --jsonl games.jsonl --pgn games.pgn
+"""
+import argparse
+import ast
+import json
+import math
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+
+import ChessAI
+import ChessEngine
+import ChessPGN
+from ChessBook import OpeningBook
+from ChessMoveOrdering import MoveOrderer
+from ChessTransposition import TranspositionTable
+
+DEFAULT_OPENING_PLIES = 8
+DEFAULT_MAX_PLIES = 300  # adjudicated a draw after this many plies
+SEARCH_LIMITS = {"depth": ("max_depth", int), "time": ("time_limit", float), "nodes": ("node_limit", int)}
+RESULT_SCORES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+
+def parseConfig(spec, name):
+    """
+    A configuration from a string of key=value settings separated by spaces or commas, called name unless it
+    says otherwise. Raises ValueError for an unknown key or a bad value.
+    """
+    config = {"name": name, "max_depth": None, "time_limit": None, "node_limit": None, "settings": {}}
+    for item in spec.replace(",", " ").split():
+        key, equals, value = item.partition("=")
+        if not equals:
+            raise ValueError("expected key=value, got %r" % item)
+        if key == "name":
+            config["name"] = value
+        elif key in SEARCH_LIMITS:
+            limit, kind = SEARCH_LIMITS[key]
+            config[limit] = kind(value)
+        elif key.isupper() and hasattr(ChessAI, key):
+            try:
+                config["settings"][key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                config["settings"][key] = value  # a bare string such as a book path
+        else:
+            raise ValueError("unknown setting %r" % key)
+    return config
+
+
+def randomOpening(rng, plies, book=None):
+    """
+    The UCI moves of a random opening of up to plies plies: weighted book moves while in book, then random moves.
+    """
+    game_state = ChessEngine.GameState()
+    moves = []
+    for ply in range(plies):
+        valid_moves = game_state.getValidMoves()
+        if not valid_moves:
+            break
+        move = book.chooseMove(game_state, valid_moves, rng) if book is not None else None
+        if move is None:
+            move = rng.choice(valid_moves)
+        game_state.makeMove(move)
+        moves.append(move.getUciNotation())
+    return moves
+
+
+def insufficientMaterial(game_state):
+    """
+    Neither side can mate: bare kings, or a lone bishop or knight against a bare king.
+    """
+    if game_state.piece_count > 3:
+        return False
+    return all(piece[1] in "KBN" for row in game_state.board for piece in row if piece != "--")
+
+
+def adjudicate(game_state, valid_moves, max_plies):
+    """
+    (result, termination) once the game is over or reaches max_plies, None while it goes on.
+    """
+    if not valid_moves:
+        if game_state.checkmate:
+            return ("0-1" if game_state.whiteToMove else "1-0"), "checkmate"
+        return "1/2-1/2", "stalemate"
+    if game_state.isThreefoldRepetition():
+        return "1/2-1/2", "threefold repetition"
+    if game_state.isFiftyMoveDraw():
+        return "1/2-1/2", "fifty-move rule"
+    if insufficientMaterial(game_state):
+        return "1/2-1/2", "insufficient material"
+    if len(game_state.moveLog) >= max_plies:
+        return "1/2-1/2", "move cap"
+    return None
+
+
+def playGame(job):
+    """
+    Play one game in a worker process and return its JSON record and its ChessPGN.PgnGame.
+    Each side searches with its own settings, transposition table and history scores, all fresh for every game.
+    """
+    index, opening, white, black, max_plies, seed = job
+    random.seed(seed)
+    sides = (white, black)
+    defaults = {key: getattr(ChessAI, key) for config in sides for key in config["settings"]}
+    searchers = [(TranspositionTable(config["settings"].get("TRANSPOSITION_TABLE_MB", ChessAI.TRANSPOSITION_TABLE_MB)),
+                  MoveOrderer())
+                 for config in sides]
+    game_state = ChessEngine.GameState()
+    moves = []
+    for uci_move in opening:
+        move = next(move for move in game_state.getValidMoves() if move.getUciNotation() == uci_move)
+        game_state.makeMove(move)
+        moves.append(move)
+    side_times = [0.0, 0.0]
+    start = time.perf_counter()
+    try:
+        while True:
+            valid_moves = game_state.getValidMoves()
+            outcome = adjudicate(game_state, valid_moves, max_plies)
+            if outcome is not None:
+                break
+            side = 0 if game_state.whiteToMove else 1
+            config = sides[side]
+            for key, value in defaults.items():
+                setattr(ChessAI, key, config["settings"].get(key, value))
+            ChessAI.transposition_table, ChessAI.move_orderer = searchers[side]
+            return_queue = queue.Queue()
+            move_start = time.perf_counter()
+            ChessAI.findBestMove(game_state, valid_moves, return_queue, max_depth=config["max_depth"],
+                                 time_limit=config["time_limit"], node_limit=config["node_limit"])
+            side_times[side] += time.perf_counter() - move_start
+            move = return_queue.get()
+            if move is None:  # the search stopped before completing a depth
+                move = ChessAI.findRandomMove(valid_moves)
+            game_state.makeMove(move)
+            moves.append(move)
+    finally:
+        for key, value in defaults.items():
+            setattr(ChessAI, key, value)
+    result, termination = outcome
+    record = {"game": index + 1,
+              "white": white["name"],
+              "black": black["name"],
+              "result": result,
+              "termination": termination,
+              "plies": len(moves),
+              "opening": opening,
+              "moves": [move.getUciNotation() for move in moves],
+              "time": time.perf_counter() - start,
+              "white_time": side_times[0],
+              "black_time": side_times[1]}
+    tags = {"Event": "Self-play %s vs %s" % (white["name"], black["name"]),
+            "Site": "ChessSelfPlay",
+            "Date": time.strftime("%Y.%m.%d"),
+            "Round": str(index + 1),
+            "White": white["name"],
+            "Black": black["name"],
+            "Termination": termination,
+            "PlyCount": str(len(moves))}
+    return record, ChessPGN.PgnGame.fromMoves(moves, tags, result)
+
+
+def scoreToElo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloDifference(wins, draws, losses):
+    """
+    (Elo difference, error) of the first configuration over the second. The error is the half width of the 95%
+    confidence interval, from the standard error of the per-game scores. Both are infinite when one side won
+    every game.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return scoreToElo(score), (scoreToElo(score + margin) - scoreToElo(score - margin)) / 2
+
+
+def runMatch(first, second, games, processes=None, opening_plies=DEFAULT_OPENING_PLIES, max_plies=DEFAULT_MAX_PLIES,
+             seed=None, book_path=None, jsonl=None, pgn=None, game_callback=None):
+    """
+    Play games between the configurations first and second over processes worker processes (one per CPU by
+    default) and return the match summary.
+    Openings are opening_plies plies long, drawn from the book at book_path (random moves only if None) and then
+    at random, reproducibly for a given seed. jsonl and pgn are text streams every finished game is written to,
+    and game_callback(record, summary) is called after every game.
+    """
+    if seed is None:
+        seed = random.randrange(1 << 31)
+    book = OpeningBook(book_path) if book_path is not None else None
+    jobs = []
+    for pair in range((games + 1) // 2):
+        opening = randomOpening(random.Random(seed * 100003 + pair), opening_plies, book)
+        for white, black in ((first, second), (second, first)):
+            if len(jobs) < games:
+                jobs.append((len(jobs), opening, white, black, max_plies, seed + len(jobs)))
+    if book is not None:
+        book.close()
+
+    summary = {"first": first["name"], "second": second["name"], "games": 0, "wins": 0, "draws": 0, "losses": 0,
+               "terminations": {}, "seed": seed, "elo": 0.0, "elo_error": math.inf, "time": 0.0, "games_per_hour": 0.0}
+    pgn_writer = ChessPGN.PgnWriter(pgn) if pgn is not None else None
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes or os.cpu_count() or 1) as pool:
+        for record, game in pool.imap_unordered(playGame, jobs):
+            score = RESULT_SCORES[record["result"]]
+            if record["white"] != first["name"]:
+                score = 1 - score
+            summary["games"] += 1
+            summary["wins" if score == 1 else "losses" if score == 0 else "draws"] += 1
+            summary["terminations"][record["termination"]] = summary["terminations"].get(record["termination"], 0) + 1
+            elapsed = time.perf_counter() - start
+            summary["elo"], summary["elo_error"] = eloDifference(summary["wins"], summary["draws"], summary["losses"])
+            summary["time"] = elapsed
+            summary["games_per_hour"] = summary["games"] / elapsed * 3600 if elapsed > 0 else 0.0
+            if jsonl is not None:
+                jsonl.write(json.dumps(record) + "\n")
+                jsonl.flush()
+            if pgn_writer is not None:
+                pgn_writer.write(game)
+            if game_callback is not None:
+                game_callback(record, summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other.")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--first", default="", help="settings of the first configuration, e.g. \"depth=3\"")
+    parser.add_argument("--second", default="", help="settings of the second configuration")
+    parser.add_argument("--processes", type=int, help="worker processes (one per CPU if left out)")
+    parser.add_argument("--opening-plies", type=int, default=DEFAULT_OPENING_PLIES,
+                        help="plies of randomised opening before the engines take over")
+    parser.add_argument("--book", default=ChessAI.OPENING_BOOK_PATH,
+                        help="book to draw the openings from, \"none\" for random moves only")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="adjudicate a draw after this")
+    parser.add_argument("--seed", type=int, help="seed of the openings")
+    parser.add_argument("--jsonl", help="file to append a JSON record of every game to")
+    parser.add_argument("--pgn", help="file to append every game to in PGN")
+    args = parser.parse_args(argv)
+
+    try:
+        first = parseConfig(args.first, "first")
+        second = parseConfig(args.second, "second")
+    except ValueError as error:
+        parser.error(str(error))
+    if first["name"] == second["name"]:
+        parser.error("the two configurations need different names")
+    book_path = None if args.book is None or args.book.lower() == "none" else args.book
+
+    def report(record, summary):
+        print("game %d: %s - %s %s (%s, %d plies, %.1fs)   %s %d-%d-%d"
+              % (record["game"], record["white"], record["black"], record["result"], record["termination"],
+                 record["plies"], record["time"], first["name"], summary["wins"], summary["losses"],
+                 summary["draws"]), flush=True)
+
+    jsonl = open(args.jsonl, "a") if args.jsonl is not None else None
+    pgn = open(args.pgn, "a") if args.pgn is not None else None
+    try:
+        summary = runMatch(first, second, args.games, args.processes, args.opening_plies, args.max_plies, args.seed,
+                           book_path, jsonl, pgn, report)
+    finally:
+        for output in (jsonl, pgn):
+            if output is not None:
+                output.close()
+    print("%s vs %s: +%d -%d =%d over %d games" % (first["name"], second["name"], summary["wins"],
+                                                    summary["losses"], summary["draws"], summary["games"]))
+    print("Elo difference %+.1f +/- %.1f (95%%)" % (summary["elo"], summary["elo_error"]))
+    print("%.1f games per hour in %.1fs, openings seed %d" % (summary["games_per_hour"], summary["time"],
+                                                               summary["seed"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Search statistics.
+Pass a SearchStats to ChessAI.findBestMove to find out what the search did: node counts, depths, branching factor,
+move ordering and transposition table quality and where the time went. Counting nodes is always on in the search;
+the phase timing wraps the timed functions only while a search with stats runs, so searches without stats pay nothing.
+"""
+import json
+import time
+
+# the phases the time of a search is split into, "search" being whatever is left over for the tree walk itself
+PHASES = ("move_generation", "make_undo", "evaluation", "search")
+MOVE_GENERATION_METHODS = ("getValidMoves", "getCaptureMoves", "getPseudoLegalMoves", "getLegalMove")
+MAKE_UNDO_METHODS = ("makeMove", "undoMove")
+
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0
+        self.leaf_nodes = 0  # nodes at the horizon of the main search, where quiescence takes over
+        self.quiescence_nodes = 0
+        self.depth_nodes = []  # nodes searched by each completed iteration, depth 1 first
+        self.depth = 0  # deepest completed iteration
+        self.score = None
+        self.best_move = None
+        self.stop_reason = None  # "depth", "time", "nodes", "stopped", "no moves", "book" or "tablebase"
+        self.time = 0.0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_hits = 0
+        self.tt_probes = 0
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self._timing = False  # inside a timed phase, so nested timed calls are not counted twice
+
+    def nodesPerSecond(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    def effectiveBranchingFactor(self):
+        """
+        Nodes of the last completed iteration divided by the nodes of the one before it.
+        """
+        if len(self.depth_nodes) < 2 or self.depth_nodes[-2] == 0:
+            return 0.0
+        return self.depth_nodes[-1] / self.depth_nodes[-2]
+
+    def firstMoveCutoffRate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def ttHitRate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def toDict(self):
+        return {"depth": self.depth,
+                "score": self.score,
+                "best_move": self.best_move,
+                "stop_reason": self.stop_reason,
+                "time": self.time,
+                "nodes": self.nodes,
+                "leaf_nodes": self.leaf_nodes,
+                "quiescence_nodes": self.quiescence_nodes,
+                "depth_nodes": list(self.depth_nodes),
+                "nps": self.nodesPerSecond(),
+                "effective_branching_factor": self.effectiveBranchingFactor(),
+                "cutoffs": self.cutoffs,
+                "first_move_cutoff_rate": self.firstMoveCutoffRate(),
+                "tt_probes": self.tt_probes,
+                "tt_hit_rate": self.ttHitRate(),
+                "phase_times": dict(self.phase_times)}
+
+    def toJson(self, indent=None):
+        return json.dumps(self.toDict(), indent=indent)
+
+    def timed(self, function, phase):
+        """
+        Wrap function so the time spent in it is added to phase.
+        """
+        phase_times = self.phase_times
+
+        def timedFunction(*args, **kwargs):
+            if self._timing:
+                return function(*args, **kwargs)
+            self._timing = True
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phase_times[phase] += time.perf_counter() - start
+                self._timing = False
+
+        return timedFunction
+
+    def instrument(self, game_state):
+        """
+        Time the move generation and make/undo methods of game_state until uninstrument is called.
+        """
+        for name in MOVE_GENERATION_METHODS:
+            setattr(game_state, name, self.timed(getattr(game_state, name), "move_generation"))
+        for name in MAKE_UNDO_METHODS:
+            setattr(game_state, name, self.timed(getattr(game_state, name), "make_undo"))
+
+    def uninstrument(self, game_state):
+        for name in MOVE_GENERATION_METHODS + MAKE_UNDO_METHODS:
+            game_state.__dict__.pop(name, None)
+        self.phase_times["search"] = max(0.0, self.time - sum(self.phase_times[phase] for phase in PHASES[:-1]))
@@ -0,0 +1,556 @@
+"""
+Endgame tablebases for 3 and 4 pieces.
+A table holds the exact result and distance to mate (in plies) of every position of one material set, for example
+KQvK or KRvKN, with the stronger side as white. Positions with the colours the other way round are looked up with the
+board flipped. Tables are built by retrograde analysis: the legal moves of every position are generated once with
+GameState to count them and to score the captures and promotions (which lead into smaller tables), then results spread
+backwards from the checkmates by un-moving pieces, one ply at a time.
+
+A table file is a header followed by one byte per position index. Positions are indexed by the side to move, the white
+king's square and the squares of the other pieces. Mirroring the board puts the white king on the queen side (and, in
+tables without pawns, on the lower half too), so only that part of the board is indexed for it.
+Castling rights and en passant are not part of a table.
+
+python ChessTablebase.py generate KQvK KRvK KPvK [--directory DIR]
+python ChessTablebase.py generate --pieces 3
+python ChessTablebase.py probe --fen FEN
+"""
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+import ChessEngine
+from ChessAttacks import (BISHOP_DIRECTIONS, DIRECTIONS, KING_SQUARES, KNIGHT_SQUARES, PAWN_CAPTURE_SQUARES,
+                          QUEEN_DIRECTIONS, RAY_SQUARES, ROOK_DIRECTIONS)
+from ChessEvaluation import piece_score
+
+TABLE_MAGIC = b"CTB1"
+HEADER_STRUCT = struct.Struct("<4s8sI")  # magic, material name, number of positions
+DEFAULT_TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAX_PIECES = 4
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# one byte per position: 0 is a draw, 1-127 a win in 2n-1 plies, 128-254 a loss in 2(n-128) plies, 255 no position
+DRAW_CODE = 0
+LOSS_CODE = 128
+INVALID_CODE = 255
+NO_DISTANCE = 255
+
+PIECE_ORDER = "KQRBNP"  # order of the pieces within a side of a material name, which writes pawns as P
+PROMOTION_PIECES = "QRBN"
+SLIDER_DIRECTIONS = {"Q": QUEEN_DIRECTIONS, "R": ROOK_DIRECTIONS, "B": BISHOP_DIRECTIONS}
+# squares each non-sliding piece attacks, as sets of square numbers
+STEP_TARGETS = {"K": [{row * 8 + col for row, col in KING_SQUARES[square]} for square in range(64)],
+                "N": [{row * 8 + col for row, col in KNIGHT_SQUARES[square]} for square in range(64)],
+                "wp": [{row * 8 + col for row, col in PAWN_CAPTURE_SQUARES["w"][square]} for square in range(64)],
+                "bp": [{row * 8 + col for row, col in PAWN_CAPTURE_SQUARES["b"][square]} for square in range(64)]}
+# index into DIRECTIONS of the ray from one square through another, None if they share no line
+LINE_DIRECTION = [[next((direction for direction in range(len(DIRECTIONS))
+                         if (target // 8, target % 8) in RAY_SQUARES[square][direction]), None)
+                   for target in range(64)] for square in range(64)]
+
+
+def encodeResult(result, plies):
+    if result == WIN:
+        return (plies + 1) // 2
+    if result == LOSS:
+        return LOSS_CODE + plies // 2
+    return DRAW_CODE
+
+
+def decodeResult(code):
+    """
+    (result, plies to mate) for the side to move, None for an index that is no legal position.
+    """
+    if code == DRAW_CODE:
+        return DRAW, 0
+    if code < LOSS_CODE:
+        return WIN, 2 * code - 1
+    if code < INVALID_CODE:
+        return LOSS, 2 * (code - LOSS_CODE)
+    return None
+
+
+def materialName(pieces):
+    """
+    The table name of a list of pieces like ["wK", "wQ", "bK"] and whether the colours have to be swapped to look it
+    up, as (name, flip). The side with more material (or, with equal material, the higher pieces) comes first.
+    """
+    sides = {"w": [], "b": []}
+    for piece in pieces:
+        sides[piece[0]].append(piece[1].upper())
+    for color in sides:
+        sides[color].sort(key=PIECE_ORDER.index)
+    white, black = "".join(sides["w"]), "".join(sides["b"])
+
+    def strength(side):
+        value = sum(piece_score[piece.replace("P", "p")] for piece in side)
+        return -value, [PIECE_ORDER.index(piece) for piece in side]
+
+    flip = strength(black) < strength(white)
+    return (black + "v" + white, True) if flip else (white + "v" + black, False)
+
+
+def namePieces(name):
+    """
+    The pieces of a material name, white (the stronger side) first: "KPvK" gives ["wK", "wp", "bK"].
+    """
+    strong, weak = name.split("v")
+    return ["w" + piece.replace("P", "p") for piece in strong] + ["b" + piece.replace("P", "p") for piece in weak]
+
+
+def flipPlacement(placement):
+    """
+    Swap the colours and mirror the ranks, so the same position is seen from the other side.
+    """
+    return [(("b" if piece[0] == "w" else "w") + piece[1], square ^ 56) for piece, square in placement]
+
+
+def placementOf(game_state):
+    return [(piece, row * 8 + col) for row, pieces in enumerate(game_state.board)
+            for col, piece in enumerate(pieces) if piece != "--"]
+
+
+class Table:
+    def __init__(self, name, data=None, offset=0):
+        self.name = name
+        # the piece on each slot of an index: white king, black king, then the other white and black pieces
+        self.pieces = ["wK", "bK"] + [piece for piece in namePieces(name) if piece[1] != "K"]
+        self.pawns = "P" in name
+        self.king_squares = [square for square in range(64)
+                             if square % 8 < 4 and (self.pawns or square // 8 >= 4)]
+        self.king_index = {square: index for index, square in enumerate(self.king_squares)}
+        self.size = 2 * len(self.king_squares) * 64 ** (len(self.pieces) - 1)
+        # slots holding the same piece, whose squares are kept sorted so every position has a single index
+        self.twins = [(first, second) for first, second in itertools.combinations(range(len(self.pieces)), 2)
+                      if self.pieces[first] == self.pieces[second]]
+        self.data = data  # the codes of every index, starting at offset
+        self.offset = offset
+
+    def index(self, squares, white_to_move):
+        """
+        Index of the position with a piece of each slot on squares, mirrored to bring the white king into place.
+        """
+        king_square = squares[0]
+        mirror = (7 if king_square % 8 >= 4 else 0) | (56 if not self.pawns and king_square // 8 < 4 else 0)
+        if mirror:
+            squares = [square ^ mirror for square in squares]
+        for first, second in self.twins:
+            if squares[first] > squares[second]:
+                squares[first], squares[second] = squares[second], squares[first]
+        index = (0 if white_to_move else 1) * len(self.king_squares) + self.king_index[squares[0]]
+        for square in squares[1:]:
+            index = index * 64 + square
+        return index
+
+    def squaresOf(self, index):
+        """
+        (squares, white_to_move) of an index, the inverse of index for the positions it can return.
+        """
+        squares = []
+        for slot in range(len(self.pieces) - 1):
+            index, square = divmod(index, 64)
+            squares.append(square)
+        side, king = divmod(index, len(self.king_squares))
+        squares.append(self.king_squares[king])
+        squares.reverse()
+        return squares, side == 0
+
+    def slotSquares(self, placement):
+        """
+        The squares of placement (a list of (piece, square) with this table's material) in slot order.
+        """
+        by_piece = {}
+        for piece, square in placement:
+            by_piece.setdefault(piece, []).append(square)
+        return [by_piece[piece].pop() for piece in self.pieces]
+
+    def probe(self, placement, white_to_move):
+        """
+        (result, plies to mate) for the side to move in a position with this table's material and white as the
+        stronger side.
+        """
+        return decodeResult(self.data[self.offset + self.index(self.slotSquares(placement), white_to_move)])
+
+
+class Tablebases:
+    """
+    The tables found in a directory, opened when first needed.
+    """
+    def __init__(self, directory=DEFAULT_TABLEBASE_DIRECTORY):
+        self.directory = directory
+        self.tables = {}  # name -> Table, None for a table that is not there
+
+    def tablePath(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = loadTable(self.tablePath(name)) if os.path.exists(self.tablePath(name)) else None
+        return self.tables[name]
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None and isinstance(table.data, mmap.mmap):
+                table.data.close()
+        self.tables = {}
+
+    def probePlacement(self, placement, white_to_move):
+        """
+        (result, plies to mate) for the side to move, None if there is no table for the material.
+        """
+        if len(placement) > MAX_PIECES:
+            return None
+        name, flip = materialName([piece for piece, square in placement])
+        if name == "KvK":
+            return DRAW, 0
+        table = self.table(name)
+        if table is None:
+            return None
+        if flip:
+            return table.probe(flipPlacement(placement), not white_to_move)
+        return table.probe(placement, white_to_move)
+
+    def probe(self, game_state):
+        """
+        (result, plies to mate) of game_state for the side to move, None when it is not covered by the tables.
+        """
+        if game_state.current_castling_rights.wks or game_state.current_castling_rights.bks or \
+                game_state.current_castling_rights.wqs or game_state.current_castling_rights.bqs:
+            return None
+        placement = placementOf(game_state)
+        if len(placement) > MAX_PIECES:
+            return None
+        if game_state.enpassant_possible:
+            row, col = game_state.enpassant_possible
+            pawn, other = ("wp", "b") if game_state.whiteToMove else ("bp", "w")
+            if any(game_state.board[pawn_row][pawn_col] == pawn
+                   for pawn_row, pawn_col in PAWN_CAPTURE_SQUARES[other][row * 8 + col]):
+                return None  # the tables do not know about the en passant capture
+        return self.probePlacement(placement, game_state.whiteToMove)
+
+    def bestMove(self, game_state, valid_moves=None):
+        """
+        A move that keeps the tablebase result of game_state: the fastest win, a draw or the slowest loss.
+        None if game_state is not covered. Moves into positions without a table are skipped, the result of
+        game_state being exact already says what the best covered move must reach.
+        """
+        result = self.probe(game_state)
+        if result is None:
+            return None
+        outcome, plies = result
+        wanted = (-outcome, plies - 1) if outcome != DRAW else (DRAW, 0)
+        if valid_moves is None:
+            valid_moves = game_state.getValidMoves()
+        for move in valid_moves:
+            game_state.makeMove(move)
+            if game_state.getValidMoves():
+                reached = self.probe(game_state)
+            else:
+                reached = (LOSS, 0) if game_state.checkmate else (DRAW, 0)
+            game_state.undoMove()
+            if reached == wanted:
+                return move
+        return None
+
+
+def loadTable(path):
+    with open(path, "rb") as table_file:
+        data = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, name, size = HEADER_STRUCT.unpack_from(data, 0)
+    name = name.rstrip(b"\0").decode("ascii")
+    table = Table(name, data, HEADER_STRUCT.size)
+    if magic != TABLE_MAGIC or size != table.size or len(data) != HEADER_STRUCT.size + size:
+        data.close()
+        raise ValueError("%s is not a tablebase file" % path)
+    return table
+
+
+def saveTable(table, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as table_file:
+        table_file.write(HEADER_STRUCT.pack(TABLE_MAGIC, table.name.encode("ascii"), table.size))
+        table_file.write(table.data)
+
+
+def dependencies(name):
+    """
+    The materials a capture or a promotion can turn name into.
+    """
+    pieces = namePieces(name)
+    names = set()
+    for index, piece in enumerate(pieces):
+        if piece[1] == "K":
+            continue
+        rest = pieces[:index] + pieces[index + 1:]
+        names.add(materialName(rest)[0])  # piece captured
+        for other, pawn in enumerate(rest):
+            if pawn[1] == "p" and pawn[0] != piece[0]:  # captured by a promoting pawn
+                for promotion in PROMOTION_PIECES:
+                    names.add(materialName(rest[:other] + [pawn[0] + promotion] + rest[other + 1:])[0])
+        if piece[1] == "p":
+            for promotion in PROMOTION_PIECES:
+                names.add(materialName(pieces[:index] + [piece[0] + promotion] + pieces[index + 1:])[0])
+    names.discard("KvK")
+    return sorted(names)
+
+
+def materialSets(piece_count):
+    """
+    The names of every table with piece_count pieces, kings included.
+    """
+    names = set()
+    for others in itertools.combinations_with_replacement("QRBNp", piece_count - 2):
+        for colors in itertools.product("wb", repeat=piece_count - 2):
+            pieces = ["wK", "bK"] + [color + piece for color, piece in zip(colors, others)]
+            names.add(materialName(pieces)[0])
+    return sorted(names)
+
+
+def generate(name, tablebases, out=None):
+    """
+    Build the table for name by retrograde analysis, building and saving the tables it depends on first.
+    The tables are saved in tablebases.directory.
+    """
+    for dependency in dependencies(name):
+        if tablebases.table(dependency) is None:
+            generate(dependency, tablebases, out)
+    start = time.perf_counter()
+    table = Table(name)
+    table.data = TableGenerator(table, tablebases).run()
+    saveTable(table, tablebases.tablePath(name))
+    tablebases.tables[name] = table
+    if out is not None:
+        out.write("%s: %d positions in %.1fs\n" % (name, table.size, time.perf_counter() - start))
+    return table
+
+
+class TableGenerator:
+    def __init__(self, table, tablebases):
+        self.table = table
+        self.tablebases = tablebases
+        self.game_state = ChessEngine.GameState()
+        self.empty_board = [["--"] * 8 for row in range(8)]
+        size = table.size
+        self.codes = bytearray([INVALID_CODE]) * size
+        self.final = bytearray(size)  # 1 once the result of a position is known
+        self.unresolved_moves = array("B", bytes(size))  # moves inside the table not yet known to lose
+        self.capture_win = array("B", [NO_DISTANCE]) * size  # fastest win by leaving the table, in plies
+        self.capture_loss = array("B", bytes(size))  # slowest loss by leaving the table, in plies
+        self.capture_draw = bytearray(size)
+        self.wins = {}  # plies -> indices to mark as won in that many plies
+        self.losses = {}
+
+    def run(self):
+        for index in range(self.table.size):
+            self.scanPosition(index)
+        plies = 0
+        while plies <= max(list(self.wins) + list(self.losses) + [0]):
+            for index in self.losses.pop(plies, ()):
+                if not self.final[index]:
+                    self.resolve(index, LOSS, plies)
+                    for predecessor in self.predecessors(index):
+                        if not self.final[predecessor]:
+                            self.wins.setdefault(plies + 1, array("I")).append(predecessor)
+            for index in self.wins.pop(plies, ()):
+                if not self.final[index]:
+                    self.resolve(index, WIN, plies)
+                    for predecessor in self.predecessors(index):
+                        if not self.final[predecessor]:
+                            self.unresolved_moves[predecessor] -= 1
+                            if self.unresolved_moves[predecessor] == 0 and not self.capture_draw[predecessor] \
+                                    and self.capture_win[predecessor] == NO_DISTANCE:
+                                loss = max(plies + 1, self.capture_loss[predecessor])
+                                self.losses.setdefault(loss, array("I")).append(predecessor)
+            plies += 1
+        for index in range(self.table.size):
+            if self.codes[index] != INVALID_CODE and not self.final[index]:
+                self.codes[index] = DRAW_CODE  # neither side can force mate
+        return bytes(self.codes)
+
+    def resolve(self, index, result, plies):
+        if plies > 252:
+            raise ValueError("%s has a mate longer than a table can store" % self.table.name)
+        self.final[index] = 1
+        self.codes[index] = encodeResult(result, plies)
+
+    def scanPosition(self, index):
+        """
+        Check if index is a legal position and, if it is, count its moves and score the ones leaving the table.
+        """
+        table = self.table
+        squares, white_to_move = table.squaresOf(index)
+        if len(set(squares)) != len(squares) or table.index(list(squares), white_to_move) != index:
+            return  # two pieces on a square, or the same position kept under another index
+        for piece, square in zip(table.pieces, squares):
+            if piece[1] == "p" and square // 8 in (0, 7):
+                return
+        board = [list(row) for row in self.empty_board]
+        for piece, square in zip(table.pieces, squares):
+            board[square // 8][square % 8] = piece
+        game_state = self.game_state
+        game_state.setupPosition(board, white_to_move)
+        waiting = 1 if white_to_move else 0  # slot of the king of the side not to move
+        if game_state.is_square_attacked(squares[waiting], "w" if white_to_move else "b"):
+            return  # the side that just moved left its king in check
+        moves = game_state.getValidMoves()
+        self.codes[index] = DRAW_CODE
+        if not moves:
+            if game_state.checkmate:
+                self.losses.setdefault(0, array("I")).append(index)
+            else:
+                self.final[index] = 1  # stalemate
+            return
+        inside = 0
+        for move in moves:
+            if move.pieceCaptured == "--" and not move.is_pawn_promotion:
+                inside += 1
+                continue
+            placement = [(piece, square) for piece, square in zip(table.pieces, squares)
+                         if square != move.endRow * 8 + move.endCol and square != move.startRow * 8 + move.startCol]
+            placed = move.pieceMoved[0] + move.promotionPiece if move.is_pawn_promotion else move.pieceMoved
+            placement.append((placed, move.endRow * 8 + move.endCol))
+            result = self.tablebases.probePlacement(placement, not white_to_move)
+            if result is None:
+                raise ValueError("%s needs the table of %s" % (table.name,
+                                                               materialName([piece for piece, _ in placement])[0]))
+            opponent_result, plies = result
+            if opponent_result == LOSS:
+                self.capture_win[index] = min(self.capture_win[index], plies + 1)
+            elif opponent_result == WIN:
+                self.capture_loss[index] = max(self.capture_loss[index], plies + 1)
+            else:
+                self.capture_draw[index] = 1
+        self.unresolved_moves[index] = inside
+        if self.capture_win[index] != NO_DISTANCE:
+            self.wins.setdefault(self.capture_win[index], array("I")).append(index)
+        elif inside == 0 and not self.capture_draw[index]:
+            self.losses.setdefault(self.capture_loss[index], array("I")).append(index)
+
+    def predecessors(self, index):
+        """
+        Indices of the positions one move (inside the table) before index, once for every move leading to it.
+        """
+        table = self.table
+        squares, white_to_move = table.squaresOf(index)
+        mover = "b" if white_to_move else "w"
+        board = [list(row) for row in self.empty_board]
+        for piece, square in zip(table.pieces, squares):
+            board[square // 8][square % 8] = piece
+        waiting_king = squares[0] if white_to_move else squares[1]
+        mover_slots = [slot for slot, piece in enumerate(table.pieces) if piece[0] == mover]
+        predecessors = []
+        for slot in mover_slots:
+            piece, square = table.pieces[slot], squares[slot]
+            for origin in self.origins(piece, square, board):
+                board[square // 8][square % 8] = "--"
+                board[origin // 8][origin % 8] = piece
+                before = list(squares)
+                before[slot] = origin
+                # before the move it was the mover's turn, so the other king cannot have been in check
+                if not any(attacks(table.pieces[other], before[other], waiting_king, board) for other in mover_slots):
+                    predecessors.append(table.index(before, not white_to_move))
+                board[origin // 8][origin % 8] = "--"
+                board[square // 8][square % 8] = piece
+        return predecessors
+
+    @staticmethod
+    def origins(piece, square, board):
+        """
+        The empty squares piece could have moved to square from without capturing or promoting.
+        """
+        kind = piece[1]
+        if kind == "K":
+            return [row * 8 + col for row, col in KING_SQUARES[square] if board[row][col] == "--"]
+        if kind == "N":
+            return [row * 8 + col for row, col in KNIGHT_SQUARES[square] if board[row][col] == "--"]
+        if kind == "p":
+            row, col = divmod(square, 8)
+            step, start_row = (1, 6) if piece[0] == "w" else (-1, 1)
+            origins = []
+            if 1 <= row + step <= 6 and board[row + step][col] == "--":
+                origins.append((row + step) * 8 + col)
+                if row + 2 * step == start_row and board[start_row][col] == "--":
+                    origins.append(start_row * 8 + col)
+            return origins
+        origins = []
+        for direction in SLIDER_DIRECTIONS[kind]:
+            for row, col in RAY_SQUARES[square][direction]:
+                if board[row][col] != "--":
+                    break
+                origins.append(row * 8 + col)
+        return origins
+
+
+def attacks(piece, square, target, board):
+    """
+    Whether piece on square attacks target on board. Cheaper than GameState.is_square_attacked with as few pieces
+    as a table has, as only the pieces of one side need checking.
+    """
+    kind = piece[1]
+    if kind == "p":
+        return target in STEP_TARGETS[piece][square]
+    if kind in STEP_TARGETS:
+        return target in STEP_TARGETS[kind][square]
+    direction = LINE_DIRECTION[square][target]
+    if direction not in SLIDER_DIRECTIONS[kind]:
+        return False
+    for row, col in RAY_SQUARES[square][direction]:
+        if row * 8 + col == target:
+            return True
+        if board[row][col] != "--":
+            return False
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="build tables and the tables they depend on")
+    generate_parser.add_argument("names", nargs="*", help="material sets like KQvK or KRvKN")
+    generate_parser.add_argument("--pieces", type=int, choices=(3, 4), help="build every table with this many pieces")
+    generate_parser.add_argument("--directory", default=DEFAULT_TABLEBASE_DIRECTORY)
+    probe_parser = subparsers.add_parser("probe", help="look up a position")
+    probe_parser.add_argument("--fen", required=True)
+    probe_parser.add_argument("--directory", default=DEFAULT_TABLEBASE_DIRECTORY)
+    args = parser.parse_args(argv)
+
+    tablebases = Tablebases(args.directory)
+    if args.command == "generate":
+        names = list(args.names) + (materialSets(args.pieces) if args.pieces else [])
+        for name in names:
+            pieces = namePieces(name) if name.count("v") == 1 else []
+            if len(pieces) > MAX_PIECES or pieces.count("wK") != 1 or pieces.count("bK") != 1 or \
+                    materialName(pieces)[0] != name:
+                print("%s is not a table name, like KQvK or KRvKN" % name)
+                return 1
+            if tablebases.table(name) is None:
+                generate(name, tablebases, sys.stdout)
+        return 0
+
+    game_state = ChessEngine.GameState()
+    game_state.loadFen(args.fen)
+    result = tablebases.probe(game_state)
+    if result is None:
+        print("not in the tablebases")
+        return 1
+    result, plies = result
+    print({WIN: "win", DRAW: "draw", LOSS: "loss"}[result] + (" in %d plies" % plies if result != DRAW else ""))
+    best_move = tablebases.bestMove(game_state)
+    if best_move is not None:
+        print("best move " + best_move.getUciNotation())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
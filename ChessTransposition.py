@@ -0,0 +1,100 @@
+"""
+Fixed-size transposition table for the negamax search.
+Entries live in flat typed arrays so the table really stays within its memory budget,
+and every bucket holds two entries: one kept for the deepest search and one that is always replaced.
+"""
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1  # the score is at least this (the search failed high)
+UPPER_BOUND = 2  # the score is at most this (the search failed low)
+
+NO_MOVE = 0xFFFF
+ENTRY_BYTES = 8 + 8 + 1 + 1 + 1 + 2  # key, score, depth, bound, age, best move
+SLOTS_PER_BUCKET = 2
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (ENTRY_BYTES * SLOTS_PER_BUCKET))
+        self.clear()
+
+    def clear(self):
+        """
+        Empty the table and reset its counters.
+        """
+        entries = self.buckets * SLOTS_PER_BUCKET
+        self.keys = array("Q", bytes(8 * entries))
+        self.scores = array("d", bytes(8 * entries))
+        self.depths = array("b", [-1]) * entries  # a depth of -1 marks an empty slot
+        self.bounds = array("B", bytes(entries))
+        self.ages = array("B", bytes(entries))
+        self.moves = array("H", [NO_MOVE]) * entries
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    def newSearch(self):
+        """
+        Mark the start of a new search, so entries left over from earlier searches are replaced first.
+        """
+        self.age = (self.age + 1) % 256
+
+    def probe(self, key):
+        """
+        Look up the position with the given Zobrist key.
+        Returns (depth, bound, score, move id) or None if the position is not in the table.
+        """
+        slot = (key % self.buckets) * SLOTS_PER_BUCKET
+        for index in (slot, slot + 1):
+            if self.depths[index] >= 0 and self.keys[index] == key:
+                self.hits += 1
+                move_id = self.moves[index]
+                return (self.depths[index], self.bounds[index], self.scores[index],
+                        None if move_id == NO_MOVE else move_id)
+        self.misses += 1
+        if self.depths[slot] >= 0 or self.depths[slot + 1] >= 0:
+            self.collisions += 1  # the bucket is in use by other positions
+        return None
+
+    def store(self, key, depth, bound, score, move_id=None):
+        """
+        Save a search result.
+        The first slot of a bucket keeps the deepest result of the current search, everything else goes to the second.
+        """
+        slot = (key % self.buckets) * SLOTS_PER_BUCKET
+        if (self.keys[slot] == key or self.depths[slot] < 0 or depth >= self.depths[slot]
+                or self.ages[slot] != self.age):
+            index = slot
+        else:
+            index = slot + 1
+        if self.depths[index] >= 0 and self.keys[index] != key:
+            self.overwrites += 1
+        self.stores += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.bounds[index] = bound
+        self.scores[index] = score
+        self.ages[index] = self.age
+        self.moves[index] = NO_MOVE if move_id is None else move_id
+
+    def stats(self):
+        """
+        Counters for tuning the table size.
+        """
+        probes = self.hits + self.misses
+        used = sum(1 for depth in self.depths if depth >= 0)
+        return {"size_mb": self.size_mb,
+                "entries": len(self.depths),
+                "used": used,
+                "fill_rate": used / len(self.depths),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / probes if probes else 0.0,
+                "collisions": self.collisions,
+                "stores": self.stores,
+                "overwrites": self.overwrites}
@@ -0,0 +1,198 @@
+"""
+UCI (Universal Chess Interface) front end.
+Reads commands from stdin and answers on stdout, so chess GUIs, match runners and servers can drive the engine
+without pygame. Supported commands: uci, isready, ucinewgame, position startpos|fen FEN [moves ...],
+go [depth N] [movetime MS] [nodes N] [wtime MS btime MS winc MS binc MS movestogo N] [infinite], stop, quit and
+setoption name Threads value N, which searches on N worker processes.
+
+python ChessUCI.py
+"""
+import sys
+import threading
+import time
+
+import ChessAI
+from ChessHeadless import Engine
+
+ENGINE_NAME = "ChessBOT"
+ENGINE_AUTHOR = "JacobisEpic"
+INFINITE_DEPTH = 64  # "go infinite" keeps deepening until stopped
+MOVES_TO_GO = 30  # moves the remaining clock time is split over when the GUI does not send movestogo
+MAX_THREADS = 64
+
+
+class UciSession:
+    def __init__(self, engine=None, out=None):
+        self.engine = engine if engine is not None else Engine()
+        self.out = out if out is not None else sys.stdout
+        self.output_lock = threading.Lock()  # info lines come from the search thread
+        self.stop_event = threading.Event()
+        self.search_thread = None
+
+    def send(self, line):
+        with self.output_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def handle(self, line):
+        """
+        Handle one command line. Returns False once the session should end.
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Threads type spin default 1 min 1 max %d" % MAX_THREADS)
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.wait()
+            self.engine.newGame()
+        elif command == "position":
+            self.wait()
+            self.position(arguments)
+        elif command == "setoption":
+            self.wait()
+            self.setOption(arguments)
+        elif command == "go":
+            self.wait()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def position(self, arguments):
+        moves_index = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments[:1] == ["startpos"]:
+            fen = None
+        elif arguments[:1] == ["fen"]:
+            fen = " ".join(arguments[1:moves_index])
+        else:
+            self.send("info string position needs startpos or fen")
+            return
+        try:
+            self.engine.setPosition(arguments[moves_index + 1:], fen)
+        except ValueError as error:
+            self.send("info string " + str(error))
+
+    def setOption(self, arguments):
+        if "name" not in arguments or "value" not in arguments:
+            self.send("info string setoption needs a name and a value")
+            return
+        name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")])
+        value = " ".join(arguments[arguments.index("value") + 1:])
+        if name.lower() != "threads":
+            self.send("info string unknown option %s %s" % (name, value))
+            return
+        try:
+            workers = int(value)
+        except ValueError:
+            self.send("info string bad value %s for option %s" % (value, name))
+            return
+        self.engine.setWorkers(min(max(workers, 1), MAX_THREADS))
+
+    def go(self, arguments):
+        limits = searchLimits(arguments, self.engine.game_state.whiteToMove)
+        self.stop_event = threading.Event()
+        self.search_thread = threading.Thread(target=self.search, args=(limits, self.stop_event), daemon=True)
+        self.search_thread.start()
+
+    def search(self, limits, stop_event):
+        start = time.perf_counter()
+        mate_depth = None  # the depth a checkmate score first came up at, the length of the mate in plies
+
+        def info(depth, score, move, nodes):
+            nonlocal mate_depth
+            if abs(score) < ChessAI.CHECKMATE:
+                mate_depth = None
+            elif mate_depth is None:
+                mate_depth = depth
+            elapsed = time.perf_counter() - start
+            self.send("info depth %d score %s nodes %d nps %d time %d pv %s"
+                      % (depth, uciScore(score, mate_depth), nodes, nodes / elapsed if elapsed > 0 else 0,
+                         elapsed * 1000, move.getUciNotation()))
+
+        move = self.engine.search(stop_event=stop_event, info_callback=info, **limits)
+        self.send("bestmove " + (move.getUciNotation() if move is not None else "0000"))
+
+    def stop(self):
+        """
+        Stop the running search, if any, and wait for it to report its best move.
+        """
+        self.stop_event.set()
+        self.wait()
+
+    def wait(self):
+        """
+        Let the running search finish. A GUI waits for bestmove before the next position, scripts piping in a
+        whole session do not.
+        """
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def searchLimits(arguments, white_to_move):
+    """
+    Turn the arguments of a go command into findBestMove keyword arguments. A limit with a value that is not a
+    whole number is ignored.
+    """
+    values = {}
+    for name, value in zip(arguments, arguments[1:]):
+        if name in ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo"):
+            try:
+                values[name] = int(value)
+            except ValueError:
+                continue
+    limits = {}
+    if "infinite" in arguments:
+        limits["max_depth"] = INFINITE_DEPTH
+    if "depth" in values:
+        limits["max_depth"] = values["depth"]
+    if "nodes" in values:
+        limits["node_limit"] = values["nodes"]
+    if "movetime" in values:
+        limits["time_limit"] = values["movetime"] / 1000
+    else:
+        clock, increment = ("wtime", "winc") if white_to_move else ("btime", "binc")
+        if clock in values:
+            remaining = values[clock]
+            budget = remaining / max(values.get("movestogo", MOVES_TO_GO), 1) + values.get(increment, 0) / 2
+            limits["time_limit"] = min(budget, remaining / 2) / 1000
+    if ("time_limit" in limits or "node_limit" in limits) and "max_depth" not in limits:
+        limits["max_depth"] = INFINITE_DEPTH  # let the budget decide how deep to go
+    return limits
+
+
+def uciScore(score, mate_plies=None):
+    """
+    The score of an info line: "mate N" in moves for a checkmate score, negative when the side to move gets mated,
+    with mate_plies the length of the mate, otherwise "cp N" in centipawns. Tablebase wins stay centipawns, as
+    their distance is counted from the probed position rather than the root.
+    """
+    if abs(score) >= ChessAI.CHECKMATE and mate_plies is not None:
+        moves = (mate_plies + 1) // 2
+        return "mate %d" % (moves if score > 0 else -moves)
+    return "cp %d" % round(score * 100)
+
+
+def main():
+    session = UciSession()
+    for line in sys.stdin:
+        if not session.handle(line):
+            break
+    session.stop()
+    session.engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Long-lived AI search process.
+The worker keeps its own GameState and ChessAI caches (transposition table, history scores) alive between moves.
+It is told about new positions with the move ids that changed since the last request, instead of a pickled GameState.
+"""
+import queue
+from multiprocessing import Process, Queue, Value
+
+import ChessAI
+import ChessEngine
+
+
+class SearchWorker:
+    def __init__(self):
+        self.requests = Queue()
+        self.results = Queue()
+        self.cancelled_id = Value("i", 0)  # every request up to this id is cancelled
+        self.process = Process(target=workerLoop, args=(self.requests, self.results, self.cancelled_id), daemon=True)
+        self.process.start()
+        self.request_id = 0
+        self.synced_move_ids = []  # the moves the worker's position is made of
+        self.finished = False
+        self.best_move_id = None
+
+    def search(self, game_state, **limits):
+        """
+        Start searching game_state in the worker, cancelling any search still running.
+        limits are passed on to ChessAI.findBestMove (max_depth, time_limit, node_limit).
+        Returns the id of the request, the result is collected with poll.
+        """
+        self.cancel()
+        move_ids = [move.moveID for move in game_state.moveLog]
+        common = 0
+        while (common < len(move_ids) and common < len(self.synced_move_ids)
+               and move_ids[common] == self.synced_move_ids[common]):
+            common += 1
+        self.request_id += 1
+        self.requests.put(("search", self.request_id, common, move_ids[common:], limits))
+        self.synced_move_ids = move_ids
+        self.finished = False
+        self.best_move_id = None
+        return self.request_id
+
+    def poll(self):
+        """
+        Non-blocking check on the latest search. Returns (finished, move id), the move id is None if no move was found.
+        """
+        while not self.finished:
+            try:
+                request_id, move_id = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if request_id == self.request_id:
+                self.finished = True
+                self.best_move_id = move_id
+        return self.finished, self.best_move_id
+
+    def cancel(self):
+        """
+        Stop the running search, its result is never reported. The worker itself keeps running.
+        """
+        self.cancelled_id.value = self.request_id
+
+    def close(self):
+        self.cancel()
+        self.requests.put(("quit",))
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class CancelFlag:
+    """
+    Stop flag for one request, set as soon as the request is cancelled.
+    """
+    def __init__(self, cancelled_id, request_id):
+        self.cancelled_id = cancelled_id
+        self.request_id = request_id
+
+    def is_set(self):
+        return self.cancelled_id.value >= self.request_id
+
+
+def workerLoop(requests, results, cancelled_id):
+    game_state = ChessEngine.GameState()
+    while True:
+        message = requests.get()
+        if message[0] == "quit":
+            break
+        _, request_id, common, move_ids, limits = message
+        syncPosition(game_state, common, move_ids)  # always, so the position matches what the parent last sent
+        cancel_flag = CancelFlag(cancelled_id, request_id)
+        if cancel_flag.is_set():
+            continue
+        return_queue = queue.Queue()
+        ChessAI.findBestMove(game_state, game_state.getValidMoves(), return_queue, stop_event=cancel_flag, **limits)
+        best_move = return_queue.get()
+        results.put((request_id, best_move.moveID if best_move is not None else None))
+
+
+def syncPosition(game_state, common, move_ids):
+    """
+    Undo game_state back to its first common moves and then play move_ids on top.
+    """
+    while len(game_state.moveLog) > common:
+        game_state.undoMove()
+    for move_id in move_ids:  # ids of moves the parent already checked, so no need to generate them again
+        game_state.makeMove(ChessEngine.Move.fromMoveID(move_id, game_state.board))
@@ -0,0 +1,46 @@
+"""
+Regression tests for the search.
+python -m unittest test_ChessAI
+"""
+import queue
+import unittest
+
+import ChessAI
+import ChessEngine
+
+
+def search(fen, depth):
+    """
+    The best move and score of fen at depth, searched without the book and the tablebases.
+    """
+    game_state = ChessEngine.GameState()
+    game_state.loadFen(fen)
+    ChessAI.transposition_table.clear()
+    result = {}
+
+    def record(depth_reached, score, move, nodes):
+        result.update(move=move.getUciNotation(), score=score)
+
+    tablebase_directory = ChessAI.TABLEBASE_DIRECTORY
+    ChessAI.TABLEBASE_DIRECTORY = None
+    try:
+        ChessAI.findBestMove(game_state, game_state.getValidMoves(), queue.Queue(), max_depth=depth,
+                             info_callback=record, use_book=False)
+    finally:
+        ChessAI.TABLEBASE_DIRECTORY = tablebase_directory
+    return result
+
+
+class SearchTest(unittest.TestCase):
+    def testMatedAfterEveryReplyIsNotStalemate(self):
+        # black is not in check, but every move walks into mate
+        self.assertEqual(search("k7/2K5/8/8/8/8/8/7R b - - 0 1", 2)["score"], -ChessAI.CHECKMATE)
+
+    def testFindsQuietMoveBeforeMate(self):
+        result = search("k7/8/2K5/8/8/8/8/7R w - - 0 1", 3)
+        self.assertIn(result["move"], ("c6c7", "c6b6"))  # both mate next move
+        self.assertEqual(result["score"], ChessAI.CHECKMATE)
+
+
+if __name__ == "__main__":
+    unittest.main()
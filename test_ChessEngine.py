@@ -0,0 +1,35 @@
+"""
+Tests for FEN loading.
+python -m unittest test_ChessEngine
+"""
+import unittest
+
+import ChessEngine
+
+
+class LoadFenTest(unittest.TestCase):
+    def assertRejected(self, fen):
+        game_state = ChessEngine.GameState()
+        with self.assertRaises(ValueError):
+            game_state.loadFen(fen)
+        self.assertEqual(game_state.getFen(), ChessEngine.GameState().getFen())  # left at the starting position
+
+    def testRejectsPawnOnBackRank(self):
+        self.assertRejected("k7/8/8/8/8/8/8/K6p b - - 0 1")
+        self.assertRejected("k6P/8/8/8/8/8/8/K7 w - - 0 1")
+
+    def testRejectsSideNotToMoveInCheck(self):
+        self.assertRejected("k6R/8/8/8/8/8/8/K7 w - - 0 1")
+        self.assertRejected("k7/8/8/8/8/1n6/8/K7 b - - 0 1")
+
+    def testLoadsLegalPosition(self):
+        fen = "k6R/8/8/8/8/8/7p/K7 b - - 0 1"  # black to move and in check is fine
+        game_state = ChessEngine.GameState()
+        game_state.loadFen(fen)
+        self.assertEqual(game_state.getFen(), fen)
+        self.assertTrue(game_state.inCheck())
+        game_state.getValidMoves()
+
+
+if __name__ == "__main__":
+    unittest.main()
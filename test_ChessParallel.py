@@ -0,0 +1,40 @@
+"""
+Tests for the parallel root search.
+python -m unittest test_ChessParallel
+"""
+import unittest
+
+import ChessAI
+import ChessEngine
+from ChessParallel import ParallelSearch, depthResults
+
+
+class ParallelSearchTest(unittest.TestCase):
+    def testWorkerWithOnlyMatedMovesReports(self):
+        # one root move a worker: Ka7 walks into Ra1#, so that worker has nothing but a mated move
+        game_state = ChessEngine.GameState()
+        game_state.loadFen("k7/2K5/8/8/8/6n1/8/7R b - - 0 1")
+        depths = []
+        tablebase_directory, opening_book_path = ChessAI.TABLEBASE_DIRECTORY, ChessAI.OPENING_BOOK_PATH
+        ChessAI.TABLEBASE_DIRECTORY = ChessAI.OPENING_BOOK_PATH = None
+        try:
+            search = ParallelSearch(len(game_state.getValidMoves()))
+            try:
+                move = search.search(game_state, max_depth=2,
+                                     info_callback=lambda depth, score, move, nodes: depths.append(depth))
+            finally:
+                search.close()
+        finally:
+            ChessAI.TABLEBASE_DIRECTORY, ChessAI.OPENING_BOOK_PATH = tablebase_directory, opening_book_path
+        self.assertEqual(depths, [1, 2])
+        self.assertEqual(move.getUciNotation(), "g3h1")
+
+    def testFinishedWorkerStandsByDeepestResult(self):
+        completed = [{1: (0.5, 10), 2: (0.2, 11)}, {1: (1.0, 20)}, {}]
+        self.assertIsNone(depthResults(completed, [False, False, True], 2))
+        self.assertEqual(depthResults(completed, [False, True, True], 2), [(0.2, 11), (1.0, 20)])
+        self.assertIsNone(depthResults(completed, [True, True, True], 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Tests for the UCI front end.
+python -m unittest test_ChessUCI
+"""
+import io
+import unittest
+
+import ChessAI
+import ChessUCI
+
+
+class UciTest(unittest.TestCase):
+    def testMalformedLimitsAreIgnored(self):
+        limits = ChessUCI.searchLimits(["depth", "x", "nodes", "1000", "wtime", "5e3", "movestogo", "0"], True)
+        self.assertEqual(limits, {"node_limit": 1000, "max_depth": ChessUCI.INFINITE_DEPTH})
+        limits = ChessUCI.searchLimits(["wtime", "6000", "btime", "6000", "movestogo", "0"], True)
+        self.assertEqual(limits["time_limit"], 3.0)
+
+    def testMalformedOptionKeepsSession(self):
+        out = io.StringIO()
+        session = ChessUCI.UciSession(engine=object(), out=out)
+        self.assertTrue(session.handle("setoption name Threads value ²"))
+        self.assertIn("bad value", out.getvalue())
+
+    def testMateScores(self):
+        self.assertEqual(ChessUCI.uciScore(ChessAI.CHECKMATE, 1), "mate 1")
+        self.assertEqual(ChessUCI.uciScore(ChessAI.CHECKMATE, 5), "mate 3")
+        self.assertEqual(ChessUCI.uciScore(-ChessAI.CHECKMATE, 4), "mate -2")
+        self.assertEqual(ChessUCI.uciScore(1.234), "cp 123")
+        self.assertEqual(ChessUCI.uciScore(ChessAI.TABLEBASE_WIN - 0.1), "cp 89990")
+
+
+if __name__ == "__main__":
+    unittest.main()